@@ -29,6 +29,10 @@ setup(
         'jinja2>=2.11.0',
     ],
     extras_require={
+        'fast': [
+            'xxhash>=3.0.0',
+            'blake3>=0.3.0',
+        ],
         'dev': [
             'pytest>=6.0.0',
             'pytest-cov>=2.10.0',
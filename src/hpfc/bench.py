@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Bench
+
+Reproducible benchmark of the comparison on synthetic folder pairs.
+A seeded generator writes a pair of trees on local disk following a profile
+(many tiny files, a few huge files, deep nesting or a mix), then changes a
+single byte at the start, middle or end of a controlled fraction of the files
+in the second tree. Each configuration of chunk size, worker count and engine
+runs in a fresh process, so its peak RSS is its own, and reports files/s,
+MB/s, peak RSS and scan time.
+"""
+
+import concurrent.futures
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+from .core import DirectoryComparer
+
+# Each profile is a list of file groups: (count, min_size, max_size, depth)
+PROFILES = {
+    "tiny": [(20_000, 1, 4 * 1024, 1)],
+    "huge": [(4, 256 * 1024 * 1024, 256 * 1024 * 1024, 0)],
+    "deep": [(2_000, 4 * 1024, 64 * 1024, 32)],
+    "mixed": [
+        (5_000, 1, 4 * 1024, 2),
+        (200, 256 * 1024, 4 * 1024 * 1024, 4),
+        (2, 128 * 1024 * 1024, 128 * 1024 * 1024, 0),
+    ],
+}
+
+# File contents are slices of one seeded pattern, so generation is I/O bound
+_PATTERN_SIZE = 1024 * 1024
+
+# Where the changed byte of a differing file goes, in rotation
+DIFF_POSITIONS = ("start", "middle", "end")
+
+
+def generate_tree_pair(
+    root: str,
+    profile: str = "mixed",
+    scale: float = 1.0,
+    diff_rate: float = 0.1,
+    seed: int = 0,
+) -> Dict:
+    """
+    Write a pair of synthetic trees, root/dir1 and root/dir2
+
+    Args:
+        root: Directory the trees are created in
+        profile: One of PROFILES
+        scale: Multiplier of the file counts of the profile
+        diff_rate: Fraction of files (0-1) that differ in dir2
+        seed: Seed of the file sizes, contents and changed files
+
+    Returns: Description of the pair with dir1, dir2, files, bytes and the number
+             of differing files per position
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown benchmark profile: {profile}")
+    rng = random.Random(seed)
+    pattern = rng.randbytes(_PATTERN_SIZE)
+    doubled = memoryview(pattern + pattern)
+    dir1 = os.path.join(root, "dir1")
+    dir2 = os.path.join(root, "dir2")
+
+    files = total_bytes = 0
+    differing = dict.fromkeys(DIFF_POSITIONS, 0)
+    for group, (count, min_size, max_size, depth) in enumerate(PROFILES[profile]):
+        for index in range(max(1, int(count * scale))):
+            levels = [f"level{level}" for level in range(depth)]
+            rel_dir = os.path.join(f"group{group}", *levels, f"d{index % 100}")
+            rel_path = os.path.join(rel_dir, f"file{index}.bin")
+            size = rng.randint(min_size, max_size)
+            offset = rng.randrange(_PATTERN_SIZE)
+
+            os.makedirs(os.path.join(dir1, rel_dir), exist_ok=True)
+            os.makedirs(os.path.join(dir2, rel_dir), exist_ok=True)
+            path1 = os.path.join(dir1, rel_path)
+            with open(path1, "wb") as f:
+                remaining = size
+                while remaining:
+                    length = min(remaining, _PATTERN_SIZE)
+                    f.write(doubled[offset:offset + length])
+                    remaining -= length
+            path2 = os.path.join(dir2, rel_path)
+            shutil.copyfile(path1, path2)
+
+            if rng.random() < diff_rate:
+                position = DIFF_POSITIONS[sum(differing.values()) % len(DIFF_POSITIONS)]
+                at = {"start": 0, "middle": size // 2, "end": size - 1}[position]
+                with open(path2, "r+b") as f:
+                    f.seek(at)
+                    byte = f.read(1)
+                    f.seek(at)
+                    f.write(bytes([byte[0] ^ 0xFF]))
+                differing[position] += 1
+
+            files += 1
+            total_bytes += size
+
+    # Written data must be clean for cold runs to evict it from the page cache
+    if hasattr(os, "sync"):
+        os.sync()
+    return {
+        "dir1": dir1,
+        "dir2": dir2,
+        "profile": profile,
+        "scale": scale,
+        "seed": seed,
+        "files": files,
+        "bytes": total_bytes,
+        "differing": differing,
+    }
+
+
+def evict_tree(directory: str) -> bool:
+    """
+    Drop the cached pages of every file in a tree, for cold-cache runs
+
+    Returns: False if the platform cannot evict pages (no posix_fadvise)
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak RSS of this process and of its largest child process, in MB"""
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def _run_case(
+    dir1: str, dir2: str, chunk_size: int, workers: int, engine: str, cold: bool
+) -> Dict:
+    """Run one benchmark configuration, in its own process"""
+    comparer = DirectoryComparer(
+        dir1,
+        dir2,
+        chunk_size=chunk_size,
+        max_workers=workers,
+        small_lane_workers=workers,
+        large_lane_workers=workers,
+        engine=engine,
+        show_progress=False,
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        if cold:
+            evict_tree(dir1)
+            evict_tree(dir2)
+        start = time.perf_counter()
+        results = comparer.compare()
+        elapsed = time.perf_counter() - start
+
+    files = results["total_files_processed"]
+    return {
+        "chunk_size": chunk_size,
+        "workers": workers,
+        "engine": engine,
+        "elapsed": elapsed,
+        "scan_time": results["phase_times"].get("scan", 0.0),
+        "phase_times": results["phase_times"],
+        "files_per_s": files / elapsed if elapsed > 0 else 0,
+        "mb_per_s": results["total_size_processed"] / (1024 * 1024) / elapsed if elapsed > 0 else 0,
+        "bytes_read": results["total_size_processed"],
+        "identical": len(results["identical_files"]),
+        "different": len(results["different_files"]),
+        "errors": len(results["error_files"]),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmark(
+    root: Optional[str] = None,
+    profile: str = "mixed",
+    scale: float = 1.0,
+    diff_rate: float = 0.1,
+    seed: int = 0,
+    chunk_sizes: Sequence[int] = (1024 * 1024, 8 * 1024 * 1024),
+    workers: Sequence[int] = (os.cpu_count() or 1,),
+    engines: Sequence[str] = ("stream", "mmap"),
+    cold: bool = False,
+    keep: bool = False,
+) -> Dict:
+    """
+    Generate a synthetic tree pair and compare it with every configuration
+
+    Args:
+        root: Directory to generate the trees in, None for a temporary directory
+        profile, scale, diff_rate, seed: Passed to generate_tree_pair
+        chunk_sizes: Chunk sizes to run
+        workers: Worker counts to run, used for both the small and large file lanes
+        engines: Comparison engines to run
+        cold: Evict the trees from the page cache before each run
+        keep: Keep the generated trees instead of deleting them
+
+    Returns: JSON-serializable report with the tree description and one entry
+             per configuration in "runs"
+    """
+    root = tempfile.mkdtemp(prefix="hpfc_bench_", dir=root)
+    try:
+        start = time.perf_counter()
+        tree = generate_tree_pair(root, profile, scale, diff_rate, seed)
+        tree["generate_time"] = time.perf_counter() - start
+
+        runs: List[Dict] = []
+        # A fresh process per configuration keeps peak RSS and warm state separate
+        context = multiprocessing.get_context("spawn")
+        for chunk_size in chunk_sizes:
+            for worker_count in workers:
+                for engine in engines:
+                    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                        runs.append(pool.submit(
+                            _run_case, tree["dir1"], tree["dir2"],
+                            chunk_size, worker_count, engine, cold,
+                        ).result())
+
+        return {"tree": tree, "cold": cold, "cpu_count": os.cpu_count(), "runs": runs}
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
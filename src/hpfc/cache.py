@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Cache
+
+Persistent on-disk cache of file content digests.
+Entries are keyed by absolute path and hash algorithm, and only trusted while
+the file's (size, mtime_ns, inode) stat tuple is unchanged, so unchanged files
+do not need to be read again on the next run.
+"""
+
+import os
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+from .hashing import DEFAULT_HASH_ALGORITHM
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (path, algorithm)
+)
+"""
+
+
+class HashCache:
+    """SQLite-backed digest cache with LRU eviction"""
+
+    def __init__(
+        self, path: str, max_entries: int = 1_000_000, algorithm: str = DEFAULT_HASH_ALGORITHM
+    ):
+        """
+        Open (or create) a digest cache
+
+        Args:
+            path: Path to the SQLite cache file
+            max_entries: Maximum number of entries kept, least recently used
+                         entries are evicted on close
+            algorithm: Hash algorithm of the digests read and written, entries of
+                       other algorithms are ignored
+        """
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        self.algorithm = algorithm
+        self.hits = 0
+        self.misses = 0
+
+        # Lookups and updates are buffered and written in one transaction on close
+        self._now = time.time_ns()
+        self._touched: List[Tuple[int, str, str]] = []
+        self._pending: List[Tuple[str, str, int, int, int, str, int]] = []
+
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+
+    def get(self, path: str, size: int, mtime_ns: int, inode: int) -> Optional[str]:
+        """Return the cached digest of a file, or None if missing or stale"""
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, inode, digest FROM entries WHERE path = ? AND algorithm = ?",
+            (path, self.algorithm),
+        ).fetchone()
+        if row is None or row[:3] != (size, mtime_ns, inode):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touched.append((self._now, path, self.algorithm))
+        return row[3]
+
+    def put(self, path: str, size: int, mtime_ns: int, inode: int, digest: str) -> None:
+        """Record the digest of a file for its current stat tuple"""
+        self._pending.append((path, self.algorithm, size, mtime_ns, inode, digest, self._now))
+
+    def flush(self) -> None:
+        """Write buffered updates to disk"""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries "
+                "(path, algorithm, size, mtime_ns, inode, digest, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+            self._conn.executemany(
+                "UPDATE entries SET last_used = ? WHERE path = ? AND algorithm = ?",
+                self._touched,
+            )
+        self._pending = []
+        self._touched = []
+
+    def evict(self) -> int:
+        """
+        Drop the least recently used entries above max_entries
+
+        Returns: Number of evicted entries
+        """
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+        return excess
+
+    def close(self) -> None:
+        """Flush pending updates, apply eviction and close the database"""
+        self.flush()
+        self.evict()
+        self._conn.close()
+
+    def __enter__(self) -> "HashCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -9,18 +9,246 @@ Command line interface for the HPFC tool.
 
 import os
 import sys
+import json
 import argparse
-from .core import DirectoryComparer
+import cProfile
+import contextlib
+from .core import (
+    DIFF_BLOCK_SIZE,
+    ENGINES,
+    HTML_MODES,
+    DirectoryComparer,
+    create_tree_manifest,
+)
+from .bench import PROFILES, run_benchmark
+from .hashing import DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS
+from .ignore import DEFAULT_IGNORE_FILES, GITIGNORE_FILE
+from .manifest import ManifestError
+from .metrics import MetricsExporter
+from .reports import REPORT_FORMATS, write_streaming_report
 from .__init__ import __version__
 
 
-def main():
+def percentage(value: str) -> float:
+    """Parse a percentage such as '5%' or '2.5' for argparse"""
+    try:
+        percent = float(value.rstrip("%"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid percentage: {value}")
+    if not 0 <= percent <= 100:
+        raise argparse.ArgumentTypeError(f"percentage must be between 0 and 100: {value}")
+    return percent
+
+
+def device_workers(value: str):
+    """Parse --per-device-workers, either a positive number or 'auto'"""
+    if value == "auto":
+        return value
+    try:
+        workers = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number or 'auto': {value}")
+    if workers < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return workers
+
+
+def ignore_files(gitignore: bool):
+    """Return the names of the ignore files read from folder roots"""
+    return DEFAULT_IGNORE_FILES + ((GITIGNORE_FILE,) if gitignore else ())
+
+
+def manifest_main(argv) -> int:
+    """Handle the manifest subcommand, which writes tree manifests"""
+    parser = argparse.ArgumentParser(
+        prog="hpfc manifest", description="Create manifests of folders to compare against."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser(
+        "create", help="Write a manifest of the paths, sizes and digests of a folder"
+    )
+    create.add_argument("dir", help="Path to the folder")
+    create.add_argument(
+        "-o", "--output", help="Manifest file to write (defaults to <folder name>.hpfm)"
+    )
+    create.add_argument(
+        "-c",
+        "--chunk-size",
+        type=int,
+        default=8 * 1024 * 1024,  # Default 8MB
+        help="Chunk size in bytes for reading files",
+    )
+    create.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of digest threads, defaults to four per CPU up to 32",
+    )
+    create.add_argument(
+        "--scan-workers",
+        type=int,
+        default=None,
+        help="Number of threads used to scan the folder, defaults to the thread pool default",
+    )
+    create.add_argument(
+        "-i",
+        "--ignore",
+        nargs="+",
+        default=[],
+        help="Patterns to ignore: names, globs, anchored /paths, dir/ or re:regex "
+        "(can specify multiple)",
+    )
+    create.add_argument(
+        "--gitignore",
+        action="store_true",
+        help="Also apply the .gitignore at the folder root (.hpfcignore is always applied)",
+    )
+    create.add_argument(
+        "--hash",
+        choices=HASH_ALGORITHMS,
+        default=DEFAULT_HASH_ALGORITHM,
+        help="Hash algorithm of the stored digests",
+    )
+    create.add_argument(
+        "--no-progress", action="store_true", help="Disable progress bar display"
+    )
+
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.dir):
+        print(f"Error: Folder does not exist - {args.dir}")
+        return 1
+
+    output = args.output or f"{os.path.basename(os.path.abspath(args.dir))}.hpfm"
+    count, errors = create_tree_manifest(
+        args.dir,
+        output,
+        chunk_size=args.chunk_size,
+        hash_algorithm=args.hash,
+        ignore_patterns=args.ignore,
+        max_workers=args.workers,
+        scan_workers=args.scan_workers,
+        show_progress=not args.no_progress,
+        ignore_files=ignore_files(args.gitignore),
+    )
+    for rel_path, error in errors:
+        print(f"Error: {rel_path} - {error}")
+    print(f"Manifest of {count} files saved to: {output}")
+    return 1 if errors else 0
+
+
+def bench_main(argv) -> int:
+    """Handle the bench subcommand, which benchmarks comparisons of synthetic folders"""
+    parser = argparse.ArgumentParser(
+        prog="hpfc bench",
+        description="Generate a reproducible pair of synthetic folders, compare it with "
+        "each configuration and print files/s, MB/s, peak RSS and scan time as JSON.",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=sorted(PROFILES),
+        default="mixed",
+        help="Shape of the folders: many tiny files, a few huge files, deep nesting or "
+        "a mix of them (default: mixed)",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplier of the number of files of the profile",
+    )
+    parser.add_argument(
+        "--diff-rate",
+        type=percentage,
+        default=10.0,
+        help="Percentage of files changed at their start, middle or end (default: 10%%)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated folders")
+    parser.add_argument(
+        "-c",
+        "--chunk-sizes",
+        type=int,
+        nargs="+",
+        default=[1024 * 1024, 8 * 1024 * 1024],
+        help="Chunk sizes in bytes to run (default: 1MB and 8MB)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[os.cpu_count() or 1],
+        help="Worker counts to run, for both the small and large file lanes "
+        "(default: CPU count)",
+    )
+    parser.add_argument(
+        "--engines",
+        choices=ENGINES,
+        nargs="+",
+        default=list(ENGINES),
+        help="Comparison engines to run (default: all)",
+    )
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="Evict the folders from the page cache before each run",
+    )
+    parser.add_argument(
+        "--root", help="Folder to generate the synthetic folders in (defaults to the temp folder)"
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the generated folders after the benchmark"
+    )
+    parser.add_argument("-o", "--output", help="File to write the JSON results to")
+
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        root=args.root,
+        profile=args.profile,
+        scale=args.scale,
+        diff_rate=args.diff_rate / 100,
+        seed=args.seed,
+        chunk_sizes=args.chunk_sizes,
+        workers=args.workers,
+        engines=args.engines,
+        cold=args.cold,
+        keep=args.keep,
+    )
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        print(f"Benchmark results saved to: {args.output}")
+    else:
+        print(report)
+    return 0
+
+
+def main(argv=None):
     """Main function, handles command line arguments and executes comparison"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "manifest":
+        return manifest_main(argv[1:])
+    if argv and argv[0] == "bench":
+        return bench_main(argv[1:])
+
     parser = argparse.ArgumentParser(
-        description="Compare files in two folders and generate a report."
+        description="Compare files in two folders and generate a report.",
+        epilog="Use 'hpfc manifest create DIR' to write a manifest for --against, "
+        "and 'hpfc bench' to benchmark comparisons of synthetic folders.",
     )
     parser.add_argument("dir1", help="Path to the first folder")
-    parser.add_argument("dir2", help="Path to the second folder")
+    parser.add_argument(
+        "dir2", nargs="?", help="Path to the second folder (omitted with --against)"
+    )
+    parser.add_argument(
+        "--against",
+        metavar="MANIFEST",
+        help="Compare the folder against a tree manifest instead of a second folder, "
+        "the manifest is the reference side",
+    )
     parser.add_argument(
         "-c",
         "--chunk-size",
@@ -33,10 +261,56 @@ def main():
         "--workers",
         type=int,
         default=None,
-        help="Number of worker processes for parallel processing, " "defaults to CPU count",
+        help="Maximum number of worker processes comparing large files, defaults to "
+        "CPU count; up to 4 are used unless --large-workers is given",
+    )
+    parser.add_argument(
+        "--small-workers",
+        type=int,
+        default=None,
+        help="Number of threads comparing small files, defaults to four per CPU up to 32",
+    )
+    parser.add_argument(
+        "--large-workers",
+        type=int,
+        default=None,
+        help="Number of processes comparing large files, defaults to the CPU count "
+        "(or --workers) up to 4",
+    )
+    parser.add_argument(
+        "--large-file-threshold",
+        type=int,
+        default=None,
+        help="Size in bytes from which files go to the large-file worker processes, "
+        "defaults to the chunk size",
     )
     parser.add_argument(
-        "-i", "--ignore", nargs="+", default=[], help="Patterns to ignore (can specify multiple)"
+        "--per-device-workers",
+        type=device_workers,
+        default=None,
+        metavar="N|auto",
+        help="Maximum number of concurrent readers per device; 'auto' limits rotational "
+        "disks (detected from sysfs on Linux) to one reader",
+    )
+    parser.add_argument(
+        "--scan-workers",
+        type=int,
+        default=None,
+        help="Number of threads used to scan both folders, defaults to the thread pool default",
+    )
+    parser.add_argument(
+        "-i",
+        "--ignore",
+        nargs="+",
+        default=[],
+        help="Patterns to ignore: names, globs, anchored /paths, dir/ or re:regex "
+        "(can specify multiple)",
+    )
+    parser.add_argument(
+        "--gitignore",
+        action="store_true",
+        help="Also apply the .gitignore files at the folder roots "
+        "(.hpfcignore is always applied)",
     )
     parser.add_argument(
         "-o", "--output", help="Save report to the specified file (defaults to console output)"
@@ -44,15 +318,144 @@ def main():
     parser.add_argument(
         "--html", action="store_true", help="Generate an HTML report instead of text"
     )
+    parser.add_argument(
+        "--html-mode",
+        choices=HTML_MODES,
+        default="auto",
+        help="HTML file lists rendered inline, or embedded as (compressed) JSON in a "
+        "searchable, paginated, virtually scrolled list; auto switches above 10000 entries",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("text", "html") + REPORT_FORMATS,
+        default=None,
+        help="Report format (default text); ndjson, json and csv stream a record per file "
+        "as results arrive and end with a summary record",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Treat files with equal size and modification time as identical without "
+        "reading their content",
+    )
+    parser.add_argument(
+        "--verify-sample",
+        type=percentage,
+        default=0.0,
+        metavar="N%",
+        help="Requires --quick, still content-check a random N%% of the files it skips",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="stream",
+        help="Content comparison engine: buffered reads (stream) or zero-copy memory maps "
+        "(mmap, best for large local files)",
+    )
+    parser.add_argument(
+        "--diff-map",
+        type=int,
+        nargs="?",
+        const=DIFF_BLOCK_SIZE,
+        default=None,
+        metavar="BLOCK_SIZE",
+        help="Report which blocks (default 4096 bytes) of differing files differ and how "
+        "many bytes, differing files are then read in full (also with --cache); "
+        "not available with --against",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="Do not compare sampled head, tail and interior blocks of large files "
+        "before reading them in full",
+    )
+    parser.add_argument(
+        "--hash",
+        choices=HASH_ALGORITHMS,
+        default=DEFAULT_HASH_ALGORITHM,
+        help="Hash algorithm used for digests (xxh3-128 and blake3 need hpfc-tool[fast], "
+        "otherwise blake2b is used)",
+    )
+    parser.add_argument(
+        "--detect-moves",
+        action="store_true",
+        help="Report missing and extra files with identical content as moved files",
+    )
+    parser.add_argument(
+        "--find-duplicates",
+        action="store_true",
+        help="Report clusters of files with identical content within each folder; "
+        "common files are hashed while compared, missing, extra and unread files "
+        "are read again",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="Persistent digest cache file, unchanged files are not read again",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=1_000_000,
+        help="Maximum number of digest cache entries (least recently used are evicted)",
+    )
+    parser.add_argument(
+        "--save-manifest",
+        metavar="PATH",
+        help="Save a manifest of this run's verdicts and stat tuples for a later --since run",
+    )
+    parser.add_argument(
+        "--since",
+        metavar="PATH",
+        help="Manifest of a previous run, files unchanged on both sides keep their verdict",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve live Prometheus metrics on http://HOST:PORT/metrics while comparing "
+        "(replaces the progress bar)",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="Address the metrics endpoint listens on (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--stats-file",
+        help="Append live stats as JSON lines to this file while comparing "
+        "(replaces the progress bar)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between two lines of the stats file (default: 10)",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Profile the run: a PATH ending in .json gets a Chrome trace of the phases and "
+        "worker batches, any other PATH a cProfile dump of the main process",
+    )
     parser.add_argument("--no-progress", action="store_true", help="Disable progress bar display")
     parser.add_argument(
         "-v", "--version", action="version", version=f"hpfc {__version__}"
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Validate directories
-    if not os.path.isdir(args.dir1):
+    if args.against:
+        if args.dir2 is not None:
+            parser.error("--against takes a single folder")
+        if not os.path.isfile(args.against):
+            print(f"Error: Manifest does not exist - {args.against}")
+            return 1
+        # The manifest is the reference side, like the first folder
+        args.dir1, args.dir2 = args.against, args.dir1
+    elif args.dir2 is None:
+        parser.error("the following arguments are required: dir2")
+    elif not os.path.isdir(args.dir1):
         print(f"Error: Folder does not exist - {args.dir1}")
         return 1
 
@@ -60,31 +463,96 @@ def main():
         print(f"Error: Folder does not exist - {args.dir2}")
         return 1
 
+    if args.since and not os.path.isfile(args.since):
+        print(f"Error: Manifest does not exist - {args.since}")
+        return 1
+
+    if args.diff_map is not None and args.against:
+        print("Error: --diff-map needs two folders and cannot be used with --against")
+        return 1
+
+    # Without --quick every file is read in full, there is nothing to sample
+    if args.verify_sample and not args.quick:
+        print("Error: --verify-sample requires --quick")
+        return 1
+
+    # Live metrics replace the progress output, which is of no use to log files
+    export_metrics = args.metrics_port is not None or bool(args.stats_file)
+
     # Create the comparer and execute comparison
     comparer = DirectoryComparer(
         args.dir1,
         args.dir2,
         chunk_size=args.chunk_size,
         max_workers=args.workers,
+        small_lane_workers=args.small_workers,
+        large_lane_workers=args.large_workers,
+        large_file_threshold=args.large_file_threshold,
+        per_device_workers=(
+            None if args.per_device_workers == "auto" else args.per_device_workers
+        ),
+        detect_rotational=args.per_device_workers == "auto",
+        scan_workers=args.scan_workers,
         ignore_patterns=args.ignore,
-        show_progress=not args.no_progress,
+        show_progress=not args.no_progress and not export_metrics,
+        quick=args.quick,
+        verify_sample=args.verify_sample,
+        hash_algorithm=args.hash,
+        prefilter=not args.no_prefilter,
+        engine=args.engine,
+        detect_moves=args.detect_moves,
+        find_duplicates=args.find_duplicates,
+        cache_path=args.cache,
+        cache_max_entries=args.cache_max_entries,
+        since_manifest=args.since,
+        save_manifest=args.save_manifest,
+        against_manifest=bool(args.against),
+        diff_block_size=args.diff_map,
+        ignore_files=ignore_files(args.gitignore),
+        trace=is_trace(args.profile),
+        log_progress=not export_metrics,
     )
 
+    exporter = contextlib.nullcontext()
+    if export_metrics:
+        exporter = MetricsExporter(
+            comparer,
+            port=args.metrics_port,
+            host=args.metrics_host,
+            stats_path=args.stats_file,
+            interval=args.stats_interval,
+        )
+
+    report_format = args.format or ("html" if args.html else "text")
+    try:
+        with exporter, profile_run(comparer, args.profile):
+            if report_format in REPORT_FORMATS:
+                return stream_report(comparer, report_format, args.output)
+            return write_report(comparer, report_format, args.output, args.html_mode)
+    except ManifestError as e:
+        # Manifests given with --since or --against are only read by the comparison
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+def write_report(comparer: DirectoryComparer, report_format: str, output, html_mode) -> int:
+    """Run the comparison and write a text or HTML report, returns the exit code"""
     results = comparer.compare()
 
-    # Generate the report
-    if args.html:
-        report = comparer.generate_html_report(results)
-    else:
-        report = comparer.generate_text_report(results)
+    with comparer.phases.span("report"):
+        # Generate the report
+        if report_format == "html":
+            report = comparer.generate_html_report(results, mode=html_mode)
+        else:
+            report = comparer.generate_text_report(results)
 
-    # Output the report
-    if args.output:
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(report)
-        print(f"Report saved to: {args.output}")
-    else:
-        print(report)
+        # Output the report
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(report)
+            print(f"Report saved to: {output}")
+        else:
+            print(report)
 
     # Return non-zero exit code if any differences, missing files, extra files
     # or errors
@@ -92,6 +560,7 @@ def main():
         bool(results["different_files"])
         or bool(results["missing_files"])
         or bool(results["extra_files"])
+        or bool(results["moved_files"])
         or bool(results["error_files"])
     )
     if has_differences:
@@ -100,5 +569,50 @@ def main():
     return 0
 
 
+def is_trace(profile) -> bool:
+    """Check whether --profile asks for a Chrome trace rather than a cProfile dump"""
+    return bool(profile) and profile.lower().endswith(".json")
+
+
+@contextlib.contextmanager
+def profile_run(comparer: DirectoryComparer, profile):
+    """Write the --profile output of the block, if any, once it is done"""
+    if not profile:
+        yield
+        return
+
+    profiler = None
+    if not is_trace(profile):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+        else:
+            comparer.write_trace(profile)
+        # Standard output may be carrying a streamed report
+        print(f"Profile saved to: {profile}", file=sys.stderr)
+
+
+def stream_report(comparer: DirectoryComparer, report_format: str, output) -> int:
+    """Run the comparison streaming a machine-readable report, returns the exit code"""
+    if output:
+        with open(output, "w", encoding="utf-8", errors="surrogateescape", newline="") as f:
+            counts = write_streaming_report(comparer, report_format, f)
+        print(f"Report saved to: {output}")
+    else:
+        # Keep progress messages out of the report on standard output
+        stream = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            counts = write_streaming_report(comparer, report_format, stream)
+
+    return 1 if any(counts.get(status) for status in (
+        "different", "missing", "extra", "moved", "error"
+    )) else 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
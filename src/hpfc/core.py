@@ -11,24 +11,534 @@ handle large volumes of files and large file sizes.
 
 import os
 import sys
-import hashlib
+import base64
+import contextlib
+import gzip
+import json
+import math
+import mmap
+import multiprocessing
+import random
+import threading
 import time
 import jinja2
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor
-from typing import Dict, List, Tuple, Optional
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from collections import Counter, defaultdict, deque
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 from datetime import datetime
 from .__init__ import __version__
+from .cache import HashCache
+from .hashing import DEFAULT_HASH_ALGORITHM, is_available, new_hasher, resolve_algorithm
+from .ignore import DEFAULT_IGNORE_FILES, IgnoreMatcher
+from .manifest import (
+    RUN_MANIFEST,
+    TREE_MANIFEST,
+    ManifestEntry,
+    ManifestError,
+    ManifestWriter,
+    read_manifest,
+)
+from .profiling import PhaseTimer, write_chrome_trace
+
+
+# Block size and number of interior blocks sampled by the prefilter
+PREFILTER_BLOCK_SIZE = 64 * 1024
+PREFILTER_INTERIOR_BLOCKS = 4
+
+# Content comparison engines: buffered reads into reused buffers, or memory maps
+ENGINES = ("stream", "mmap")
+
+# Default block size of difference maps
+DIFF_BLOCK_SIZE = 4096
+
+# Read buffers reused across files by each worker thread
+_local = threading.local()
+
+
+def _read_buffers(size: int) -> Tuple[bytearray, bytearray]:
+    """
+    Return this thread's pair of reusable read buffers, at least size bytes long
+
+    Buffers only grow, so a thread that only sees small files keeps small buffers.
+    """
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None or len(buffers[0]) < size:
+        buffers = (bytearray(size), bytearray(size))
+        _local.buffers = buffers
+    return buffers
+
+
+def _views_equal(view1: memoryview, view2: memoryview) -> bool:
+    """
+    Compare two equally long byte views without copying them
+
+    Byte-wise memoryview comparison is slow, so the 8-byte aligned prefix is
+    compared as unsigned 64-bit words and only the few trailing bytes are copied.
+    """
+    aligned = len(view1) - len(view1) % 8
+    if aligned and view1[:aligned].cast("Q") != view2[:aligned].cast("Q"):
+        return False
+    return view1[aligned:].tobytes() == view2[aligned:].tobytes()
+
+
+def _prefilter_offsets(size: int) -> List[int]:
+    """
+    Offsets of the head, tail and evenly spaced interior blocks sampled by the prefilter
+
+    Most real differences (headers, trailers, appended records) show up in one of
+    these blocks, so they are checked before reading the whole file.
+    """
+    last = size - PREFILTER_BLOCK_SIZE
+    step = last // (PREFILTER_INTERIOR_BLOCKS + 1)
+    return [0, last] + [step * i for i in range(1, PREFILTER_INTERIOR_BLOCKS + 1)]
+
+
+def _should_prefilter(size: int, chunk_size: int) -> bool:
+    """Files that fit in one chunk are read in a single pass anyway"""
+    return size > max(chunk_size, 16 * PREFILTER_BLOCK_SIZE)
+
+
+class ReadStats:
+    """Bytes read and seconds spent reading and hashing, filled in by the read functions"""
+
+    __slots__ = ("bytes_read", "read_time", "hash_time")
+
+    def __init__(self):
+        self.bytes_read = 0
+        self.read_time = 0.0
+        self.hash_time = 0.0
+
+
+def _sampled_blocks_match(f1, f2, size: int, stats: Optional[ReadStats] = None) -> bool:
+    """Compare the prefilter blocks of two open files"""
+    for offset in _prefilter_offsets(size):
+        f1.seek(offset)
+        f2.seek(offset)
+        block1 = f1.read(PREFILTER_BLOCK_SIZE)
+        block2 = f2.read(PREFILTER_BLOCK_SIZE)
+        if stats is not None:
+            stats.bytes_read += len(block1) + len(block2)
+        if block1 != block2:
+            return False
+    return True
+
+
+def _compare_mapped(
+    f1, f2, size: int, chunk_size: int, prefilter: bool, stats: Optional[ReadStats] = None
+) -> bool:
+    """Compare two open files through read-only memory maps, without copying chunks"""
+    with mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ) as m1, mmap.mmap(
+        f2.fileno(), 0, access=mmap.ACCESS_READ
+    ) as m2:
+        # The files may have changed since they were scanned
+        if len(m1) != len(m2):
+            return False
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            m1.madvise(mmap.MADV_SEQUENTIAL)
+            m2.madvise(mmap.MADV_SEQUENTIAL)
+
+        with memoryview(m1) as view1, memoryview(m2) as view2:
+            offsets = []
+            if prefilter and _should_prefilter(size, chunk_size):
+                offsets = [(offset, PREFILTER_BLOCK_SIZE) for offset in _prefilter_offsets(size)]
+            offsets.extend((offset, chunk_size) for offset in range(0, len(m1), chunk_size))
+
+            for offset, length in offsets:
+                end = offset + length
+                if stats is not None:
+                    # Pages are faulted in as they are compared
+                    stats.bytes_read += 2 * (min(end, len(m1)) - offset)
+                if not _views_equal(view1[offset:end], view2[offset:end]):
+                    return False
+        return True
+
+
+def compare_file_contents(
+    file1: Path,
+    file2: Path,
+    chunk_size: int,
+    size: Optional[int] = None,
+    prefilter: bool = True,
+    engine: str = "stream",
+    stats: Optional[ReadStats] = None,
+) -> bool:
+    """
+    Compare the contents of two files chunk by chunk
+
+    Both files are read in lockstep and the comparison stops at the first
+    differing chunk, so identical files cost a single read pass without any
+    hashing and differing files are usually rejected after a few chunks.
+    With prefilter, files larger than a chunk first have sampled blocks compared,
+    so differences near the end are found without a full read.
+
+    The stream engine reads into pre-allocated buffers reused across files, the
+    mmap engine compares slices of memory maps of both files without any copies.
+    With stats, the bytes read from both files and the elapsed time are added to it.
+
+    Returns: True if the contents are identical, False otherwise
+    """
+    start = time.perf_counter()
+    try:
+        return _compare_contents(file1, file2, chunk_size, size, prefilter, engine, stats)
+    finally:
+        if stats is not None:
+            stats.read_time += time.perf_counter() - start
+
+
+def _compare_contents(
+    file1: Path,
+    file2: Path,
+    chunk_size: int,
+    size: Optional[int],
+    prefilter: bool,
+    engine: str,
+    stats: Optional[ReadStats],
+) -> bool:
+    with open(file1, "rb") as f1, open(file2, "rb") as f2:
+        if size is None:
+            size = os.fstat(f1.fileno()).st_size
+
+        # Empty files cannot be mapped
+        if engine == "mmap" and size > 0:
+            return _compare_mapped(f1, f2, size, chunk_size, prefilter, stats)
+
+        if prefilter and _should_prefilter(size, chunk_size):
+            if not _sampled_blocks_match(f1, f2, size, stats):
+                return False
+            f1.seek(0)
+            f2.seek(0)
+
+        # Small files only need a buffer as large as themselves
+        length = min(chunk_size, max(size, 1))
+        buffer1, buffer2 = _read_buffers(length)
+        with memoryview(buffer1) as base1, memoryview(buffer2) as base2:
+            view1, view2 = base1[:length], base2[:length]
+            while True:
+                read1 = f1.readinto(view1)
+                read2 = f2.readinto(view2)
+                if stats is not None:
+                    stats.bytes_read += read1 + read2
+                if read1 != read2:
+                    return False
+                if read1 < length:
+                    # Last partial chunk
+                    return _views_equal(view1[:read1], view2[:read2])
+                if length == len(buffer1):
+                    # Whole buffers compare with a single memcmp
+                    if buffer1 != buffer2:
+                        return False
+                elif not _views_equal(view1, view2):
+                    return False
+
+
+def _diff_blocks(
+    view1: memoryview, view2: memoryview, offset: int, block_size: int, runs: List[List[int]]
+) -> int:
+    """
+    Record the differing blocks of two equally long views starting at a file offset
+
+    Differing blocks are merged into runs of [first_block, block_count], and their
+    differing bytes are counted from the XOR of both blocks.
+
+    Returns: Number of differing bytes in the views
+    """
+    diff_bytes = 0
+    for start in range(0, len(view1), block_size):
+        end = start + block_size
+        block1 = view1[start:end]
+        block2 = view2[start:end]
+        if _views_equal(block1, block2):
+            continue
+        xored = int.from_bytes(block1, "little") ^ int.from_bytes(block2, "little")
+        diff_bytes += len(block1) - xored.to_bytes(len(block1), "little").count(0)
+        index = (offset + start) // block_size
+        if runs and runs[-1][0] + runs[-1][1] == index:
+            runs[-1][1] += 1
+        else:
+            runs.append([index, 1])
+    return diff_bytes
+
+
+def diff_file_blocks(
+    file1: Path,
+    file2: Path,
+    chunk_size: int,
+    block_size: int = DIFF_BLOCK_SIZE,
+    size: Optional[int] = None,
+    engine: str = "stream",
+    stats: Optional[ReadStats] = None,
+    hashers: Tuple = (None, None),
+) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Map the fixed-size blocks in which two equally sized files differ
+
+    Unlike compare_file_contents, both files are read in full, but still in a
+    single pass: equal chunks are skipped with one comparison and only differing
+    chunks are split into blocks. Identical files cost the same as a plain
+    comparison. With stats, the bytes read and the elapsed time are added to it.
+    Hashers given for either file (see new_hasher) are fed every chunk read
+    from it, so the digests come out of the same pass.
+
+    Returns: (runs, differing_bytes) where runs are (first_block, block_count) of
+             consecutive differing blocks, empty if the files are identical
+    """
+    runs = []
+    diff_bytes = 0
+    hash_time = 0.0
+    start = time.perf_counter()
+
+    def feed(chunk1: memoryview, chunk2: memoryview) -> None:
+        nonlocal hash_time
+        started = time.perf_counter()
+        for hasher, chunk in zip(hashers, (chunk1, chunk2)):
+            if hasher is not None:
+                hasher.update(chunk)
+        hash_time += time.perf_counter() - started
+
+    # Chunks are whole blocks, so blocks never straddle two reads
+    length = max(block_size, chunk_size - chunk_size % block_size)
+    with open(file1, "rb") as f1, open(file2, "rb") as f2:
+        if size is None:
+            size = os.fstat(f1.fileno()).st_size
+
+        # Empty files cannot be mapped
+        if engine == "mmap" and size > 0:
+            with mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ) as m1, mmap.mmap(
+                f2.fileno(), 0, access=mmap.ACCESS_READ
+            ) as m2, memoryview(m1) as view1, memoryview(m2) as view2:
+                end = min(len(m1), len(m2))
+                for offset in range(0, end, length):
+                    stop = min(offset + length, end)
+                    with view1[offset:stop] as chunk1, view2[offset:stop] as chunk2:
+                        feed(chunk1, chunk2)
+                        if not _views_equal(chunk1, chunk2):
+                            diff_bytes += _diff_blocks(chunk1, chunk2, offset, block_size, runs)
+            if stats is not None:
+                stats.bytes_read += 2 * end
+                stats.read_time += time.perf_counter() - start - hash_time
+                stats.hash_time += hash_time
+            return [tuple(run) for run in runs], diff_bytes
+
+        length = min(length, max(size, 1))
+        buffer1, buffer2 = _read_buffers(length)
+        offset = 0
+        with memoryview(buffer1) as base1, memoryview(buffer2) as base2:
+            view1, view2 = base1[:length], base2[:length]
+            while True:
+                read = min(f1.readinto(view1), f2.readinto(view2))
+                if not read:
+                    break
+                feed(view1[:read], view2[:read])
+                if read == len(buffer1):
+                    # Whole buffers compare with a single memcmp
+                    equal = buffer1 == buffer2
+                else:
+                    equal = _views_equal(view1[:read], view2[:read])
+                if not equal:
+                    diff_bytes += _diff_blocks(
+                        view1[:read], view2[:read], offset, block_size, runs
+                    )
+                offset += read
+    if stats is not None:
+        stats.bytes_read += 2 * offset
+        stats.read_time += time.perf_counter() - start - hash_time
+        stats.hash_time += hash_time
+    return [tuple(run) for run in runs], diff_bytes
+
+
+def _hash_buffer(size: int) -> bytearray:
+    """
+    Return this thread's reusable hashing buffer, at least size bytes long
+
+    Separate from the comparison buffers and sized by the files actually hashed,
+    so threads hashing small files keep small buffers.
+    """
+    buffer = getattr(_local, "hash_buffer", None)
+    if buffer is None or len(buffer) < size:
+        buffer = bytearray(size)
+        _local.hash_buffer = buffer
+    return buffer
+
+
+def file_digest(
+    file_path: Path,
+    chunk_size: int,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    limit: Optional[int] = None,
+    stats: Optional[ReadStats] = None,
+) -> str:
+    """
+    Calculate the digest of a file with the given hash algorithm
+
+    The file is read in chunks to avoid loading it entirely into memory.
+    With a limit, only the first limit bytes are hashed (a partial hash).
+    With stats, the bytes read and the time spent reading and hashing are added to it.
+    """
+    hasher = new_hasher(algorithm)
+    if limit is not None:
+        chunk_size = min(chunk_size, max(limit, 1))
+    with open(file_path, "rb") as f:
+        # No chunk needs to be larger than the file
+        chunk_size = max(1, min(chunk_size, os.fstat(f.fileno()).st_size))
+        with memoryview(_hash_buffer(chunk_size)) as base:
+            view = base[:chunk_size]
+            remaining = limit
+            while remaining is None or remaining > 0:
+                started = time.perf_counter()
+                read = f.readinto(
+                    view if remaining is None else view[: min(chunk_size, remaining)]
+                )
+                if stats is not None:
+                    read_done = time.perf_counter()
+                    stats.read_time += read_done - started
+                    stats.bytes_read += read
+                if not read:
+                    break
+                hasher.update(view[:read])
+                if stats is not None:
+                    stats.hash_time += time.perf_counter() - read_done
+                if remaining is not None:
+                    remaining -= read
+    return hasher.hexdigest()
+
+
+class FileStat(NamedTuple):
+    """Compact stat record captured once per file while scanning"""
+
+    size: int
+    mtime_ns: int
+    inode: int
+    dev: int
+
+
+# Statuses of FileResult
+RESULT_STATUSES = ("identical", "different", "missing", "extra", "moved", "error")
+
+
+class FileResult(NamedTuple):
+    """Compact per-file comparison record returned by workers"""
+
+    rel_path: str
+    status: str  # "identical", "different", "missing", "extra", "moved" or "error"
+    error: Optional[str] = None  # Read error, also of missing and extra move candidates
+    digest1: Optional[str] = None
+    digest2: Optional[str] = None
+    moved_from: Optional[str] = None  # Path in dir1 of a file moved to rel_path in dir2
+    diff_blocks: Optional[List[Tuple[int, int]]] = None  # Runs of differing blocks
+    diff_bytes: Optional[int] = None  # Number of differing bytes
+    bytes_read: int = 0  # Bytes read from both files to reach the verdict
+    read_time: float = 0.0  # Seconds spent reading (and comparing) them
+    hash_time: float = 0.0  # Seconds spent hashing them
+
+
+def _compare_batch(
+    dir1: str,
+    dir2: str,
+    batch: List[Tuple[str, int, Optional[str], Optional[str]]],
+    chunk_size: int,
+    digest_algorithm: Optional[str] = None,
+    prefilter: bool = True,
+    engine: str = "stream",
+    block_size: Optional[int] = None,
+) -> Tuple[List[FileResult], Tuple[int, int, float, float]]:
+    """
+    Compare a batch of equally sized file pairs in a worker process
+
+    Each batch entry is (rel_path, size, digest1, digest2) where a digest is only
+    set if it is already known. With a digest_algorithm, both files are digested
+    instead of streamed so the digests can be cached by the caller. With a
+    block_size, files that differ get a map of their differing blocks, and with
+    both options the digests are computed in the same read pass as the map.
+    Every result carries the bytes read and the time spent reading and hashing,
+    including for errors, so the parent can aggregate real throughput.
+
+    Returns: (results, span) with one FileResult per batch entry, in batch order,
+             and the (pid, thread id, start, end) wall-clock span of the batch
+    """
+    started = time.time()
+    results = []
+    for rel_path, size, digest1, digest2 in batch:
+        file1 = os.path.join(dir1, rel_path)
+        file2 = os.path.join(dir2, rel_path)
+        diff_blocks = diff_bytes = None
+        stats = ReadStats()
+        try:
+            if block_size and not (digest1 is not None and digest1 == digest2):
+                hashers = (None, None)
+                if digest_algorithm is not None:
+                    hashers = tuple(
+                        new_hasher(digest_algorithm) if digest is None else None
+                        for digest in (digest1, digest2)
+                    )
+                runs, diff_bytes = diff_file_blocks(
+                    file1, file2, chunk_size, block_size, size, engine, stats, hashers
+                )
+                if hashers[0] is not None:
+                    digest1 = hashers[0].hexdigest()
+                if hashers[1] is not None:
+                    digest2 = hashers[1].hexdigest()
+                is_identical = not runs
+                if runs:
+                    diff_blocks = runs
+                else:
+                    diff_bytes = None
+            elif digest_algorithm is not None:
+                if digest1 is None:
+                    digest1 = file_digest(file1, chunk_size, digest_algorithm, stats=stats)
+                if digest2 is None:
+                    digest2 = file_digest(file2, chunk_size, digest_algorithm, stats=stats)
+                is_identical = digest1 == digest2
+            else:
+                is_identical = compare_file_contents(
+                    file1, file2, chunk_size, size, prefilter, engine, stats
+                )
+        except Exception as e:
+            results.append(FileResult(
+                rel_path, "error", str(e),
+                bytes_read=stats.bytes_read, read_time=stats.read_time, hash_time=stats.hash_time,
+            ))
+            continue
+
+        status = "identical" if is_identical else "different"
+        results.append(FileResult(
+            rel_path, status, None, digest1, digest2, None, diff_blocks, diff_bytes,
+            stats.bytes_read, stats.read_time, stats.hash_time,
+        ))
+    return results, (os.getpid(), threading.get_ident(), started, time.time())
+
+
+def _process_context():
+    """Multiprocessing context of the worker processes, never forking this process"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
 
 
 class ProgressBar:
-    """Simple progress bar for console output"""
+    """
+    Console progress bar weighted by bytes, rendered by a ticker thread
+
+    update() only stores counters, so it costs next to nothing in result
+    collection loops. A daemon thread redraws the bar every interval. When a byte
+    total is known, the percentage and ETA follow bytes rather than files, so a
+    few huge files at the end do not show as nearly done, and the ETA uses an
+    exponentially weighted moving average of the throughput.
+    """
 
     def __init__(
-        self, total: int, prefix: str = "", suffix: str = "", length: int = 50, fill: str = "█"
+        self,
+        total: int,
+        prefix: str = "",
+        suffix: str = "",
+        length: int = 50,
+        fill: str = "█",
+        total_bytes: int = 0,
+        interval: float = 0.2,
+        smoothing: float = 5.0,
     ):
         """
-        Initialize progress bar
+        Initialize progress bar and start its ticker thread
 
         Args:
             total: Total number of items
@@ -36,60 +546,860 @@ class ProgressBar:
             suffix: Suffix string
             length: Bar length
             fill: Bar fill character
+            total_bytes: Total number of bytes of the items, 0 to track items only
+            interval: Seconds between two redraws
+            smoothing: Time constant in seconds of the throughput average
         """
         self.total = total
         self.prefix = prefix
         self.suffix = suffix
         self.length = length
         self.fill = fill
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.smoothing = smoothing
         self.iteration = 0
-        self.start_time = time.time()
-        self.last_update = 0
+        self.bytes_done = 0
+        self.start_time = time.monotonic()
+
+        # Only touched by the thread drawing the bar
+        self._rate = None  # Smoothed bytes/s, or items/s without a byte total
+        self._last = (self.start_time, 0)
+        self._width = 0
+
+        self._closed = threading.Event()
         self._print_progress()
+        self._ticker = threading.Thread(target=self._tick, name="hpfc-progress", daemon=True)
+        self._ticker.start()
+
+    def __enter__(self) -> "ProgressBar":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def update(self, iteration: Optional[int] = None, nbytes: int = 0) -> None:
+        """
+        Record progress, the bar is redrawn by the ticker thread
 
-    def update(self, iteration: Optional[int] = None) -> None:
-        """Update progress bar"""
+        Args:
+            iteration: Number of items done, None to count one more
+            nbytes: Bytes of the items done since the last update
+        """
         if iteration is not None:
             self.iteration = iteration
         else:
             self.iteration += 1
+        self.bytes_done += nbytes
+
+    def close(self) -> None:
+        """Stop the ticker thread and print the final bar and a summary line"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._ticker.join()
+        self._print_progress()
 
-        # Only update display every 0.1 seconds to avoid excessive printing
-        current_time = time.time()
-        if current_time - self.last_update >= 0.1 or self.iteration == self.total:
-            self.last_update = current_time
+        elapsed = time.monotonic() - self.start_time
+        speed = self.iteration / elapsed if elapsed > 0 else 0
+        summary = f"\nCompleted in {elapsed:.2f}s ({speed:.2f} items/s"
+        if self.total_bytes:
+            byte_speed = self.bytes_done / elapsed if elapsed > 0 else 0
+            summary += f", {byte_speed / (1024*1024):.2f} MB/s"
+        print(summary + ")")
+
+    def _tick(self) -> None:
+        while not self._closed.wait(self.interval):
             self._print_progress()
 
     def _print_progress(self) -> None:
         """Print the progress bar"""
-        percent = "{0:.1f}".format(100 * (self.iteration / float(self.total)))
-        filled_length = int(self.length * self.iteration // self.total)
+        now = time.monotonic()
+        iteration = self.iteration
+        by_bytes = self.total_bytes > 0
+        done, total = (self.bytes_done, self.total_bytes) if by_bytes else (iteration, self.total)
+        fraction = min(1.0, done / total) if total else 1.0
+        filled_length = int(self.length * fraction)
         bar = self.fill * filled_length + "-" * (self.length - filled_length)
 
+        # Smooth the throughput, starting from the average up to the first progress
+        last_time, last_done = self._last
+        if self._rate is None:
+            if done and now > self.start_time:
+                self._rate = done / (now - self.start_time)
+        elif now > last_time:
+            weight = 1 - math.exp(-(now - last_time) / self.smoothing)
+            self._rate += weight * ((done - last_done) / (now - last_time) - self._rate)
+        self._last = (now, done)
+
         # Calculate ETA
-        if self.iteration > 0:
-            elapsed = time.time() - self.start_time
-            items_per_second = self.iteration / elapsed
-            eta = (self.total - self.iteration) / items_per_second if items_per_second > 0 else 0
+        if self._rate:
+            eta = max(0, total - done) / self._rate
             eta_str = f"ETA: {int(eta // 60)}m {int(eta % 60)}s"
+            rate_str = (
+                f"{self._rate / (1024*1024):.1f} MB/s" if by_bytes else f"{self._rate:.1f} items/s"
+            )
         else:
             eta_str = "ETA: --"
+            rate_str = "--/s"
 
         # Create the progress line
-        progress_line = (
-            f"\r{self.prefix} |{bar}| {percent}% {self.iteration}/{self.total} "
-            f"{eta_str} {self.suffix}"
-        )
-
-        # Print progress bar
-        sys.stdout.write(progress_line)
+        progress_line = f"{self.prefix} |{bar}| {100 * fraction:.1f}% {iteration}/{self.total}"
+        if by_bytes:
+            progress_line += (
+                f" ({self.bytes_done / (1024*1024):.1f}/{total / (1024*1024):.1f} MB)"
+            )
+        progress_line += f" {rate_str} {eta_str} {self.suffix}"
+
+        # Pad over the rest of a longer previous line
+        padding = " " * max(0, self._width - len(progress_line))
+        self._width = len(progress_line)
+        sys.stdout.write("\r" + progress_line + padding)
         sys.stdout.flush()
 
-        # Print new line on complete
-        if self.iteration == self.total:
-            elapsed = time.time() - self.start_time
-            speed = self.total / elapsed if elapsed > 0 else 0
-            print(f"\nCompleted in {elapsed:.2f}s ({speed:.2f} items/s)")
+
+def is_rotational_device(dev: int) -> bool:
+    """
+    Check whether a device (st_dev) is a rotational disk
+
+    Uses the queue/rotational flag in sysfs on Linux, following a partition up to
+    its parent disk. Always False on other platforms or for devices without a
+    block device, such as network mounts.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    base = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    for candidate in (base, os.path.join(base, "..")):
+        try:
+            with open(os.path.join(candidate, "queue", "rotational"), encoding="ascii") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return False
+
+
+class _Lane:
+    """
+    A worker pool with an in-flight batch limit tuned from observed throughput
+
+    After each measurement window the limit is moved one step, and the direction
+    is reversed whenever throughput dropped compared to the previous window.
+    The files and bytes read by completed batches are counted for live metrics.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        executor,
+        workers: int,
+        groups: Dict[Tuple[int, ...], Iterator[List[tuple]]],
+        by_bytes: bool,
+        max_limit: Optional[int] = None,
+        tune_interval: float = 0.5,
+        rate_window: float = 10.0,
+    ):
+        """
+        Args:
+            name: Lane name used in statistics
+            executor: Executor the lane submits batches to
+            workers: Number of workers of the executor
+            groups: Batch iterators of this lane, keyed by the devices the batches read
+            by_bytes: Measure throughput in bytes/s instead of files/s
+            max_limit: Highest in-flight limit, None for two batches per worker
+            tune_interval: Length of a measurement window in seconds
+            rate_window: Seconds over which throughput() is measured
+        """
+        self.name = name
+        self.executor = executor
+        self.groups = groups
+        self.by_bytes = by_bytes
+        self.tune_interval = tune_interval
+
+        # Allow up to two batches per worker in flight to hide dispatch latency
+        self.max_limit = max(1, max_limit or workers * 2)
+        self.limit = max(1, workers)
+        self.in_flight = 0
+
+        self._step = 1
+        self._last_rate = None
+        self._window_start = time.monotonic()
+        self._window_units = 0
+
+        # Totals of completed batches, and samples of them over the rate window
+        self.files_done = 0
+        self.bytes_read = 0
+        self.rate_window = rate_window
+        self._samples = deque([(self._window_start, 0, 0)])
+
+    def next_batch(
+        self, devices_free: Callable[[Tuple[int, ...]], bool]
+    ) -> Optional[Tuple[Tuple[int, ...], List[tuple]]]:
+        """
+        Return the next (devices, batch) to run, or None
+
+        Nothing is returned while the lane is at its limit, and batches are only
+        taken from groups whose devices have a free slot.
+        """
+        if self.in_flight >= self.limit:
+            return None
+        for devices in list(self.groups):
+            if not devices_free(devices):
+                continue
+            batch = next(self.groups[devices], None)
+            if batch is None:
+                del self.groups[devices]
+                continue
+            return devices, batch
+        return None
+
+    def record(self, files: int, nbytes: int) -> None:
+        """Record a completed batch and retune the limit at the end of a window"""
+        self.in_flight -= 1
+        self._window_units += nbytes if self.by_bytes else files
+
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.tune_interval:
+            return
+
+        rate = self._window_units / elapsed
+        if self._last_rate is not None and rate < self._last_rate:
+            self._step = -self._step
+        self.limit = min(self.max_limit, max(1, self.limit + self._step))
+        self._last_rate = rate
+        self._window_start = now
+        self._window_units = 0
+
+    def account(self, files: int, bytes_read: int) -> None:
+        """Count the files and bytes read of a completed batch"""
+        self.files_done += files
+        self.bytes_read += bytes_read
+        now = time.monotonic()
+        samples = self._samples
+        samples.append((now, self.files_done, self.bytes_read))
+        # Keep the last sample from before the window as its starting point
+        while len(samples) > 2 and samples[1][0] <= now - self.rate_window:
+            samples.popleft()
+
+    def throughput(self) -> Tuple[float, float]:
+        """Return the recent (files/s, bytes/s) of the lane, over about rate_window seconds"""
+        start, files, nbytes = self._samples[0]
+        elapsed = time.monotonic() - start
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (self.files_done - files) / elapsed, (self.bytes_read - nbytes) / elapsed
+
+
+# HTML report modes
+HTML_MODES = ("auto", "inline", "scalable", "compressed")
+
+# Largest number of listed entries rendered inline by the "auto" HTML report mode
+HTML_INLINE_LIMIT = 10_000
+
+# Shared by inline and scalable reports, compiled once on first use
+_HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Folder Comparison Report</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: 0;
+            padding: 20px;
+            color: #333;
+        }
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+        }
+        .header {
+            background-color: #f8f9fa;
+            padding: 20px;
+            border-radius: 5px;
+            margin-bottom: 20px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+        .summary {
+            display: grid;
+            grid-template-columns: 1fr 1fr;
+            gap: 20px;
+            margin-bottom: 30px;
+        }
+        .info-box {
+            background-color: #fff;
+            border-radius: 5px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+            padding: 15px;
+        }
+        .stats {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 10px;
+            margin-bottom: 20px;
+        }
+        .stat-box {
+            flex: 1;
+            min-width: 150px;
+            background-color: #fff;
+            border-radius: 5px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+            padding: 15px;
+            text-align: center;
+        }
+        .details {
+            margin-top: 30px;
+        }
+        .section {
+            margin-bottom: 30px;
+        }
+        h1 {
+            color: #2c3e50;
+            margin: 0 0 10px 0;
+        }
+        h2 {
+            color: #3498db;
+            margin: 0 0 15px 0;
+            padding-bottom: 10px;
+            border-bottom: 1px solid #eee;
+        }
+        h3 {
+            color: #555;
+        }
+        .file-list {
+            background-color: #f8f9fa;
+            padding: 15px;
+            border-radius: 5px;
+            max-height: 300px;
+            overflow-y: auto;
+        }
+        .file-list ul {
+            list-style-type: none;
+            padding: 0;
+            margin: 0;
+        }
+        .file-list li {
+            padding: 5px 10px;
+            border-bottom: 1px solid #eee;
+            word-break: break-all;
+        }
+        .different {
+            background-color: #ffecb3;
+        }
+        .block-diff {
+            font-size: 0.85em;
+            color: #777;
+        }
+        .viewer-controls {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 10px;
+            align-items: center;
+            margin-bottom: 10px;
+        }
+        .viewer-controls button, .viewer-pages button {
+            padding: 5px 10px;
+            border: 1px solid #ccc;
+            border-radius: 4px;
+            background-color: #fff;
+            cursor: pointer;
+        }
+        .viewer-controls button.active {
+            background-color: #4285f4;
+            border-color: #4285f4;
+            color: #fff;
+        }
+        .viewer-controls input {
+            flex: 1;
+            min-width: 200px;
+            padding: 5px 10px;
+        }
+        .virtual-list {
+            position: relative;
+            height: 500px;
+            max-height: none;
+            padding: 0;
+        }
+        .virtual-list .spacer {
+            position: relative;
+        }
+        .virtual-list .row {
+            position: absolute;
+            left: 0;
+            right: 0;
+            height: 28px;
+            line-height: 28px;
+            padding: 0 10px;
+            border-bottom: 1px solid #eee;
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
+        }
+        .viewer-pages {
+            display: flex;
+            gap: 10px;
+            align-items: center;
+            justify-content: center;
+            margin-top: 10px;
+        }
+        .missing {
+            background-color: #ffcdd2;
+        }
+        .extra {
+            background-color: #c8e6c9;
+        }
+        .moved {
+            background-color: #bbdefb;
+        }
+        .duplicate {
+            background-color: #e1bee7;
+        }
+        .error {
+            background-color: #ffcdd2;
+            color: #d32f2f;
+        }
+        .timestamp {
+            font-size: 0.8em;
+            color: #777;
+            margin-top: 5px;
+        }
+        .stat-title {
+            font-size: 0.9em;
+            color: #555;
+            margin-bottom: 5px;
+        }
+        .stat-value{
+            font-size: 1.6em;
+            font-weight: bold;
+        }
+        .warning {
+            color: #e74c3c;
+        }
+        .success {
+            color: #27ae60;
+        }
+        .footer {
+            margin-top: 50px;
+            text-align: center;
+            padding: 20px;
+            color: #777;
+            font-size: 0.9em;
+            border-top: 1px solid #eee;
+        }
+        .footer a {
+            color: #3498db;
+            text-decoration: none;
+        }
+        .footer a:hover {
+            text-decoration: underline;
+        }
+        .project-links {
+            margin-top: 10px;
+            display: flex;
+            justify-content: center;
+            gap: 20px;
+        }
+        .project-link {
+            display: inline-flex;
+            align-items: center;
+            padding: 5px 10px;
+            border-radius: 4px;
+            background-color: #f8f9fa;
+            transition: background-color 0.2s ease;
+        }
+        .project-link:hover {
+            background-color: #e9ecef;
+        }
+        .project-link img {
+            margin-right: 5px;
+            width: 16px;
+            height: 16px;
+        }
+        @media (max-width: 768px) {
+            .summary {
+                grid-template-columns: 1fr;
+            }
+            .stats {
+                flex-direction: column;
+            }
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>Folder Comparison Report</h1>
+            <div class="timestamp">Generated on: {{ timestamp }}</div>
+        </div>
+
+        <div class="summary">
+            <div class="info-box">
+                <h3>Folder 1</h3>
+                <p>{{ dir1 }}</p>
+            </div>
+            <div class="info-box">
+                <h3>Folder 2</h3>
+                <p>{{ dir2 }}</p>
+            </div>
+        </div>
+
+        <div class="stats">
+            <div class="stat-box">
+                <div class="stat-title">Total Files</div>
+                <div class="stat-value">{{ total_files }}</div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-title">Identical Files</div>
+                <div class="stat-value
+                    {% if identical_files_count == total_files %}success{% endif %}">
+                    {{ identical_files_count }}
+                </div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-title">Different Files</div>
+                <div class="stat-value
+                    {% if different_files_count > 0 %}warning{% endif %}">
+                    {{ different_files_count }}
+                </div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-title">Missing Files</div>
+                <div class="stat-value{% if missing_files_count > 0 %}warning{% endif %}">
+                    {{ missing_files_count }}
+                </div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-title">Extra Files</div>
+                <div class="stat-value{% if extra_files_count > 0 %}warning{% endif %}">
+                    {{ extra_files_count }}
+                </div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-title">Moved Files</div>
+                <div class="stat-value{% if moved_files_count > 0 %} warning{% endif %}">
+                    {{ moved_files_count }}
+                </div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-title">Error Files</div>
+                <div class="stat-value{% if error_files_count > 0 %}warning{% endif %}">
+                    {{ error_files_count }}
+                </div>
+            </div>
+        </div>
+
+        <div class="info-box">
+            <h3>Performance Metrics</h3>
+            <p>Total data processed: {{ data_processed }} MB</p>
+            <p>Processing time: {{ time_elapsed }} seconds</p>
+            <p>Processing speed: {{ speed }} MB/s</p>
+            <p>Read time: {{ read_time }} seconds, hash time: {{ hash_time }} seconds
+               (summed over workers)</p>
+            <p>Phase times: {{ phase_times }}</p>
+        </div>
+
+        <div class="details">
+            {% if report_data %}
+            <div class="section">
+                <h2>Files</h2>
+                <div class="viewer-controls">
+                    <span id="viewer-tabs"></span>
+                    <input id="viewer-search" type="search" placeholder="Filter entries...">
+                </div>
+                <div id="viewer-status" class="timestamp"></div>
+                <div id="viewer-list" class="file-list virtual-list">
+                    <div id="viewer-spacer" class="spacer"></div>
+                </div>
+                <div class="viewer-pages">
+                    <button id="viewer-prev">&larr; Previous</button>
+                    <span id="viewer-page"></span>
+                    <button id="viewer-next">Next &rarr;</button>
+                </div>
+            </div>
+            <script type="application/json" id="report-data"
+                    data-encoding="{{ data_encoding }}">{{ report_data|safe }}</script>
+            <script>
+            (function () {
+                var ROW_HEIGHT = 28;
+                var PAGE_SIZE = 100000;
+                var CATEGORIES = [
+                    ["different", "Different"], ["missing", "Missing"], ["extra", "Extra"],
+                    ["moved", "Moved"], ["duplicate", "Duplicates"], ["error", "Errors"]
+                ];
+                var list = document.getElementById("viewer-list");
+                var spacer = document.getElementById("viewer-spacer");
+                var search = document.getElementById("viewer-search");
+                var data = {}, category = null, rows = [], page = 0, pending = false;
+
+                function load() {
+                    var element = document.getElementById("report-data");
+                    if (element.dataset.encoding !== "gzip") {
+                        return Promise.resolve(JSON.parse(element.textContent));
+                    }
+                    var bytes = Uint8Array.from(atob(element.textContent.trim()), function (c) {
+                        return c.charCodeAt(0);
+                    });
+                    var stream = new Blob([bytes]).stream()
+                        .pipeThrough(new DecompressionStream("gzip"));
+                    return new Response(stream).text().then(JSON.parse);
+                }
+
+                function pageCount() {
+                    return Math.max(1, Math.ceil(rows.length / PAGE_SIZE));
+                }
+
+                function render() {
+                    pending = false;
+                    var start = page * PAGE_SIZE;
+                    var count = Math.max(0, Math.min(PAGE_SIZE, rows.length - start));
+                    spacer.style.height = (count * ROW_HEIGHT) + "px";
+                    var first = Math.floor(list.scrollTop / ROW_HEIGHT);
+                    var visible = Math.ceil(list.clientHeight / ROW_HEIGHT) + 1;
+                    var last = Math.min(count, first + visible);
+                    var fragment = document.createDocumentFragment();
+                    for (var i = first; i < last; i++) {
+                        var row = document.createElement("div");
+                        row.className = "row";
+                        row.style.top = (i * ROW_HEIGHT) + "px";
+                        row.textContent = row.title = rows[start + i];
+                        fragment.appendChild(row);
+                    }
+                    spacer.replaceChildren(fragment);
+                    document.getElementById("viewer-status").textContent =
+                        rows.length + " of " + (data[category] || []).length + " entries";
+                    document.getElementById("viewer-page").textContent =
+                        "Page " + (page + 1) + " of " + pageCount();
+                    document.getElementById("viewer-prev").disabled = page === 0;
+                    document.getElementById("viewer-next").disabled = page + 1 >= pageCount();
+                }
+
+                function schedule() {
+                    if (!pending) {
+                        pending = true;
+                        requestAnimationFrame(render);
+                    }
+                }
+
+                function filter() {
+                    var query = search.value.toLowerCase();
+                    var all = data[category] || [];
+                    rows = query ? all.filter(function (entry) {
+                        return entry.toLowerCase().indexOf(query) !== -1;
+                    }) : all;
+                    page = Math.min(page, pageCount() - 1);
+                    list.scrollTop = 0;
+                    schedule();
+                }
+
+                function select(name) {
+                    category = name;
+                    page = 0;
+                    var buttons = document.querySelectorAll("#viewer-tabs button");
+                    for (var i = 0; i < buttons.length; i++) {
+                        buttons[i].className = buttons[i].value === name ? "active" : "";
+                    }
+                    filter();
+                }
+
+                function turn(delta) {
+                    page = Math.min(Math.max(page + delta, 0), pageCount() - 1);
+                    list.scrollTop = 0;
+                    schedule();
+                }
+
+                var timer = null;
+                search.addEventListener("input", function () {
+                    clearTimeout(timer);
+                    timer = setTimeout(filter, 150);
+                });
+                list.addEventListener("scroll", schedule);
+                document.getElementById("viewer-prev").addEventListener("click", function () {
+                    turn(-1);
+                });
+                document.getElementById("viewer-next").addEventListener("click", function () {
+                    turn(1);
+                });
+
+                load().then(function (loaded) {
+                    data = loaded;
+                    var tabs = document.getElementById("viewer-tabs");
+                    var initial = null;
+                    CATEGORIES.forEach(function (entry) {
+                        var entries = data[entry[0]] || [];
+                        var button = document.createElement("button");
+                        button.value = entry[0];
+                        button.textContent = entry[1] + " (" + entries.length + ")";
+                        button.addEventListener("click", function () { select(entry[0]); });
+                        tabs.appendChild(button);
+                        if (initial === null && entries.length) {
+                            initial = entry[0];
+                        }
+                    });
+                    select(initial || CATEGORIES[0][0]);
+                });
+            })();
+            </script>
+            {% endif %}
+
+            {% if different_files %}
+            <div class="section">
+                <h2>Files with Different Content</h2>
+                <div class="file-list different">
+                    <ul>
+                    {% for file in different_files %}
+                        <li>{{ file }}
+                        {% if file in block_diffs %}
+                            <div class="block-diff">{{ block_diffs[file] }}</div>
+                        {% endif %}
+                        </li>
+                    {% endfor %}
+                    </ul>
+                </div>
+            </div>
+            {% endif %}
+
+            {% if missing_files %}
+            <div class="section">
+                <h2>Missing Files (in folder1 but not in folder2)</h2>
+                <div class="file-list missing">
+                    <ul>
+                    {% for file in missing_files %}
+                        <li>{{ file }}</li>
+                    {% endfor %}
+                    </ul>
+                </div>
+            </div>
+            {% endif %}
+
+            {% if extra_files %}
+            <div class="section">
+                <h2>Extra Files (in folder2 but not in folder1)</h2>
+                <div class="file-list extra">
+                    <ul>
+                    {% for file in extra_files %}
+                        <li>{{ file }}</li>
+                    {% endfor %}
+                    </ul>
+                </div>
+            </div>
+            {% endif %}
+
+            {% if moved_files %}
+            <div class="section">
+                <h2>Moved Files (folder1 path &rarr; folder2 path)</h2>
+                <div class="file-list moved">
+                    <ul>
+                    {% for old_path, new_path in moved_files %}
+                        <li>{{ old_path }} &rarr; {{ new_path }}</li>
+                    {% endfor %}
+                    </ul>
+                </div>
+            </div>
+            {% endif %}
+
+            {% if duplicate_files %}
+            <div class="section">
+                <h2>Duplicate Content ({{ duplicate_wasted }} MB wasted)</h2>
+                <div class="file-list duplicate">
+                    <ul>
+                    {% for cluster in duplicate_files %}
+                        <li>
+                            {{ cluster.size }} bytes,
+                            {{ "%.2f"|format(cluster.wasted_bytes / 1048576) }} MB wasted
+                            <ul>
+                            {% for file in cluster.files1 %}
+                                <li>folder1: {{ file }}</li>
+                            {% endfor %}
+                            {% for file in cluster.files2 %}
+                                <li>folder2: {{ file }}</li>
+                            {% endfor %}
+                            </ul>
+                        </li>
+                    {% endfor %}
+                    </ul>
+                </div>
+            </div>
+            {% endif %}
+
+            {% if error_files %}
+            <div class="section">
+                <h2>Error Files</h2>
+                <div class="file-list error">
+                    <ul>
+                    {% for file, error in error_files %}
+                        <li>{{ file }}: {{ error }}</li>
+                    {% endfor %}
+                    </ul>
+                </div>
+            </div>
+            {% endif %}
+        </div>
+
+        <div class="footer">
+            <p>Generated by <strong>{{ repo_name }}</strong> v{{ version }}</p>
+            <p>Created by <strong>{{ author }}</strong></p>
+            <div class="project-links">
+                <a href="{{ github_url }}" target="_blank" class="project-link">
+                    <img src="https://github.com/favicon.ico" alt="GitHub"> GitHub Project
+                </a>
+                <a href="{{ pypi_url }}" target="_blank" class="project-link">
+                    <img src="https://pypi.org/static/images/favicon.ico" alt="PyPI"> PyPI Package
+                </a>
+            </div>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+_compiled_html_template = None
+
+
+def _html_template() -> jinja2.Template:
+    """Return the compiled HTML report template, compiling it on first use"""
+    global _compiled_html_template
+    if _compiled_html_template is None:
+        environment = jinja2.Environment(autoescape=True)
+        _compiled_html_template = environment.from_string(_HTML_TEMPLATE)
+    return _compiled_html_template
+
+
+def format_block_diff(diff: Dict) -> str:
+    """Describe a difference map, such as '3 blocks of 4096 bytes, 17 bytes differ: 0-1, 7'"""
+    runs = ", ".join(
+        str(first) if count == 1 else f"{first}-{first + count - 1}"
+        for first, count in diff["runs"]
+    )
+    return (
+        f"{diff['differing_blocks']} blocks of {diff['block_size']} bytes, "
+        f"{diff['differing_bytes']} bytes differ: {runs}"
+    )
+
+
+def format_phase_times(results: Dict) -> str:
+    """
+    Format the timing breakdown of comparison results
+
+    Returns: e.g. "scan 1.20s (/a 1.20s, /b 0.80s), wait 3.10s, collect 0.20s;
+             worker batches 12.40s busy, 0.30s queued or in transit"
+    """
+    parts = []
+    scan_times = results.get("scan_times", {})
+    for phase, seconds in results.get("phase_times", {}).items():
+        part = f"{phase} {seconds:.2f}s"
+        if phase == "scan" and scan_times:
+            part += " (" + ", ".join(f"{d} {t:.2f}s" for d, t in scan_times.items()) + ")"
+        parts.append(part)
+    text = ", ".join(parts) or "none"
+    worker_times = results.get("worker_times")
+    if worker_times and worker_times["busy"]:
+        text += (
+            f"; worker batches {worker_times['busy']:.2f}s busy, "
+            f"{worker_times['transit']:.2f}s queued or in transit"
+        )
+    return text
 
 
 class DirectoryComparer:
@@ -103,6 +1413,31 @@ class DirectoryComparer:
         max_workers: Optional[int] = None,
         ignore_patterns: List[str] = None,
         show_progress: bool = True,
+        cache_path: Optional[str] = None,
+        cache_max_entries: int = 1_000_000,
+        batch_max_files: int = 256,
+        batch_max_bytes: int = 64 * 1024 * 1024,  # 64MB per batch
+        scan_workers: Optional[int] = None,
+        quick: bool = False,
+        verify_sample: float = 0.0,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM,
+        prefilter: bool = True,
+        engine: str = "stream",
+        small_lane_workers: Optional[int] = None,
+        large_lane_workers: Optional[int] = None,
+        large_file_threshold: Optional[int] = None,
+        per_device_workers: Optional[int] = None,
+        device_workers: Optional[Dict[int, int]] = None,
+        detect_rotational: bool = False,
+        detect_moves: bool = False,
+        find_duplicates: bool = False,
+        since_manifest: Optional[str] = None,
+        save_manifest: Optional[str] = None,
+        against_manifest: bool = False,
+        diff_block_size: Optional[int] = None,
+        ignore_files: Tuple[str, ...] = DEFAULT_IGNORE_FILES,
+        trace: bool = False,
+        log_progress: bool = True,
     ):
         """
         Initialize the comparison tool
@@ -111,17 +1446,115 @@ class DirectoryComparer:
             dir1: Path to the first directory
             dir2: Path to the second directory
             chunk_size: Size of chunks for file comparison, used for handling large files
-            max_workers: Maximum number of worker processes for parallel processing,
-                         None for CPU count
-            ignore_patterns: List of file/directory patterns to ignore
+            max_workers: Maximum number of worker processes for parallel processing
+                         of large files, None for CPU count
+            ignore_patterns: List of file/directory patterns to ignore, plain names,
+                             globs, anchored paths or "re:" regexes (see hpfc.ignore)
             show_progress: Whether to show progress bar
+            cache_path: Path to a persistent digest cache, None to disable caching.
+                        Files whose (size, mtime_ns, inode) match a cached entry are
+                        not read again
+            cache_max_entries: Maximum number of cache entries, least recently used
+                               entries are evicted beyond this
+            batch_max_files: Maximum number of files sent to a worker in one task
+            batch_max_bytes: Maximum total size of the files sent to a worker in one task,
+                             a larger file is sent on its own
+            scan_workers: Number of threads used to scan both directory trees,
+                          None for the thread pool default
+            quick: Treat files with equal size and mtime as identical without reading
+                   their content
+            verify_sample: Percentage (0-100) of files passed by quick mode that are
+                           still content-checked, to catch silent corruption
+            hash_algorithm: Digest used wherever file hashes are needed, one of
+                            sha256, blake2b, xxh3-128, blake3 or crc32. Falls back to
+                            blake2b if an optional backend is not installed
+            prefilter: Compare head, tail and sampled interior blocks of large files
+                       before reading them in full
+            engine: Content comparison engine, "stream" reads into reused buffers and
+                    "mmap" compares memory maps of both files without copies
+                    (best for large local files)
+            small_lane_workers: Number of threads comparing small files, None for
+                                four per CPU up to 32
+            large_lane_workers: Number of processes comparing large files, None for
+                                the CPU count (or max_workers) up to 4
+            large_file_threshold: Files at least this large go to the large-file
+                                  process lane, None for chunk_size
+            per_device_workers: Maximum number of batches reading from the same device
+                                (st_dev) at once, None for no limit
+            device_workers: Per-device overrides of per_device_workers, keyed by st_dev
+            detect_rotational: Limit rotational disks (detected from sysfs on Linux)
+                               to one batch at a time to avoid seek thrashing
+            detect_moves: Report missing and extra files with identical content as
+                          moved files instead
+            find_duplicates: Build a content index across both directories and report
+                             clusters of duplicate files within each tree
+            since_manifest: Run manifest of a previous comparison, common files whose
+                            stat tuples are unchanged on both sides keep their verdict
+            save_manifest: Write a run manifest of this comparison to this path
+            against_manifest: dir1 is a tree manifest (see create_tree_manifest) used as
+                              the reference side, so only dir2 is read and its files
+                              are compared by digest
+            diff_block_size: Map the differing blocks of this size of every compared
+                             file that differs, reading differing files in full
+                             instead of stopping at the first difference. With a
+                             cache, digests are computed in the same pass.
+                             Not available against a manifest. None to disable
+            ignore_files: Names of gitignore-style files read from the root of each
+                          directory, their rules apply to both trees
+            trace: Record spans of the comparison phases and worker batches, saved
+                   with write_trace
+            log_progress: Without a progress bar, print a line per completed batch
         """
         self.dir1 = os.path.abspath(dir1)
         self.dir2 = os.path.abspath(dir2)
         self.chunk_size = chunk_size
         self.max_workers = max_workers
         self.ignore_patterns = ignore_patterns or []
+        self.ignore_files = tuple(ignore_files)
         self.show_progress = show_progress
+        self.log_progress = log_progress
+        self.cache_path = cache_path
+        self.cache_max_entries = cache_max_entries
+        self.batch_max_files = batch_max_files
+        self.batch_max_bytes = batch_max_bytes
+        self.scan_workers = scan_workers
+        self.quick = quick
+        self.verify_sample = verify_sample
+        self.hash_algorithm = resolve_algorithm(hash_algorithm)
+        self.prefilter = prefilter
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown comparison engine: {engine}")
+        self.engine = engine
+        self.small_lane_workers = small_lane_workers
+        self.large_lane_workers = large_lane_workers
+        self.large_file_threshold = large_file_threshold or chunk_size
+        self.per_device_workers = per_device_workers
+        self.device_workers = device_workers or {}
+        limits = list(self.device_workers.values())
+        if per_device_workers is not None:
+            limits.append(per_device_workers)
+        if limits and min(limits) < 1:
+            raise ValueError("Per-device worker limits must be at least 1")
+        self.detect_rotational = detect_rotational
+        self.detect_moves = detect_moves
+        self.find_duplicates = find_duplicates
+        self.since_manifest = since_manifest
+        self.save_manifest = save_manifest
+        self.against_manifest = against_manifest
+        # Compiled once, ignore files of both trees apply to both sides
+        self.ignore_matcher = IgnoreMatcher.for_trees(
+            [self.dir2] if against_manifest else [self.dir1, self.dir2],
+            self.ignore_patterns,
+            self.ignore_files,
+        )
+        self._reference_digests = {}  # Digests of the reference side, against a manifest
+        self._duplicate_keys = set()  # (side, rel_path) of duplicate index candidates
+        if diff_block_size is not None and diff_block_size < 1:
+            raise ValueError("Difference map block size must be at least 1")
+        if diff_block_size and against_manifest:
+            # The reference side is a manifest, only its digests are known
+            raise ValueError("Difference maps need both folders, not a manifest")
+        self.diff_block_size = diff_block_size
 
         # Comparison results
         self.different_files = []  # Files with different content
@@ -129,189 +1562,976 @@ class DirectoryComparer:
         self.extra_files = []  # Files present in dir2 but not in dir1
         self.identical_files = []  # Files that are completely identical
         self.error_files = []  # Files that caused errors during comparison
+        self.moved_files = []  # (path in dir1, path in dir2) pairs of moved files
+        self.duplicate_files = []  # Clusters of files with identical content within a tree
+        self.block_diffs = {}  # Difference maps of differing files, by rel_path
+        self.scan_errors = []  # Paths that could not be read while scanning
 
         # Performance statistics
         self.total_files_processed = 0
-        self.total_size_processed = 0
+        self.total_size_processed = 0  # Bytes actually read, from both folders
+        self.read_time = 0.0  # Seconds spent reading, summed over all workers
+        self.hash_time = 0.0  # Seconds spent hashing, summed over all workers
         self.start_time = None
         self.end_time = None
 
-    def should_ignore(self, path: str) -> bool:
-        """Check if a path should be ignored"""
-        rel_path = os.path.basename(path)
-        for pattern in self.ignore_patterns:
-            if pattern in rel_path:
-                return True
-        return False
+        # Timing breakdown, see the profiling module
+        self.trace = trace
+        self.phases = PhaseTimer(trace)
+        self.scan_times = {}  # Seconds until each tree was scanned
+        self.worker_times = {"busy": 0.0, "transit": 0.0}  # Summed over batches
+
+        # Live state read by metrics exporters while a comparison runs
+        self.status_counts = Counter(dict.fromkeys(RESULT_STATUSES, 0))
+        self.lanes = []
+
+    def should_ignore(self, path: str, is_dir: bool = False) -> bool:
+        """Check if a file or directory path, relative to the tree root, should be ignored"""
+        return self.ignore_matcher.match(path, is_dir)
 
-    def get_files_dict(self, directory: str) -> Dict[str, Path]:
+    def _scan_directory(
+        self, root: str, prefix: str
+    ) -> Tuple[List[Tuple[str, FileStat]], List[Tuple[str, str]], List[Tuple[str, str]]]:
         """
-        Get a dictionary of all files in the directory with their relative and absolute paths
+        List a single directory, used as a scan work unit
 
-        Returns: {relative_path: Path_object}
+        Returns: (files, subdirectories, errors) where files are (rel_path, FileStat),
+                 subdirectories are (absolute_path, rel_path) and errors are (rel_path, error)
         """
-        files_dict = {}
-        for root, _, files in os.walk(directory):
-            if self.should_ignore(root):
-                continue
+        files, subdirs, errors = [], [], []
+        matcher = self.ignore_matcher or None
+        try:
+            with os.scandir(root) as it:
+                entries = list(it)
+        except OSError as e:
+            errors.append((prefix or ".", str(e)))
+            return files, subdirs, errors
+
+        for entry in entries:
+            rel_path = os.path.join(prefix, entry.name) if prefix else entry.name
+            try:
+                if entry.is_dir():
+                    # Like os.walk, symlinked directories are not followed, and ignored
+                    # directories are pruned before descending into them
+                    if not entry.is_symlink() and not (
+                        matcher and matcher.match(rel_path, is_dir=True)
+                    ):
+                        subdirs.append((entry.path, rel_path))
+                    continue
 
-            for file in files:
-                if self.should_ignore(file):
+                if matcher and matcher.match(rel_path):
                     continue
 
-                full_path = os.path.join(root, file)
-                # Calculate path relative to base_dir
-                rel_path = os.path.relpath(full_path, directory)
-                files_dict[rel_path] = Path(full_path)
+                st = entry.stat()
+            except OSError as e:
+                errors.append((rel_path, str(e)))
+                continue
 
-        return files_dict
+            files.append((rel_path, FileStat(st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)))
+
+        return files, subdirs, errors
+
+    def scan_trees(self, directories: List[str]) -> List[Dict[str, FileStat]]:
+        """
+        Scan several directory trees concurrently
+
+        Every directory is a separate work unit on a shared thread pool, so the trees
+        are walked at the same time and large trees are split across threads as their
+        subdirectories are discovered. Entries that cannot be read are recorded in
+        scan_errors, and the time until each tree was fully scanned in scan_times.
+
+        Returns: One {relative_path: FileStat} dictionary per directory, in order
+        """
+        files_dicts = [{} for _ in directories]
+        start = time.time()
+        units = [1] * len(directories)  # Work units in flight per directory
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+            in_flight = {
+                executor.submit(self._scan_directory, directory, ""): index
+                for index, directory in enumerate(directories)
+            }
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = in_flight.pop(future)
+                    files, subdirs, errors = future.result()
+                    files_dicts[index].update(files)
+                    self.scan_errors.extend(errors)
+                    for path, rel_path in subdirs:
+                        in_flight[executor.submit(self._scan_directory, path, rel_path)] = index
+                    units[index] += len(subdirs) - 1
+                    if not units[index]:
+                        end = time.time()
+                        self.scan_times[directories[index]] = end - start
+                        # One track per tree, the trees are scanned at the same time
+                        self.phases.add_span(
+                            f"scan {directories[index]}", start, end, tid=index + 1,
+                            files=len(files_dicts[index]),
+                        )
+
+        return files_dicts
+
+    def get_files_dict(self, directory: str) -> Dict[str, FileStat]:
+        """
+        Get a dictionary of all files in the directory with their stat records
+
+        The tree is walked with os.scandir and every file is stat'ed exactly once,
+        later comparison stages reuse these records instead of calling stat again.
+
+        Returns: {relative_path: FileStat}
+        """
+        return self.scan_trees([directory])[0]
 
     def calculate_file_hash(self, file_path: Path) -> str:
         """
-        Calculate SHA256 hash of a file
+        Calculate the digest of a file with the configured hash algorithm
 
         For large files, read in chunks to avoid loading the entire file into memory
         """
-        sha256_hash = hashlib.sha256()
-
+        stats = ReadStats()
         try:
-            with open(file_path, "rb") as f:
-                # Read file in chunks
-                for byte_block in iter(lambda: f.read(self.chunk_size), b""):
-                    sha256_hash.update(byte_block)
-            return sha256_hash.hexdigest()
+            return file_digest(file_path, self.chunk_size, self.hash_algorithm, stats=stats)
         except Exception as e:
             self.error_files.append((str(file_path), str(e)))
             return None
+        finally:
+            self._account(stats)
 
     def compare_files(self, rel_path: str, file1: Path, file2: Path) -> bool:
         """
         Compare two files to determine if they are identical
 
         First compares file size, if different returns False
-        Then compares file content or hash
+        Then streams both files in lockstep, stopping at the first differing chunk
 
         Returns: True if files are identical, False otherwise
         """
+        stats = ReadStats()
         try:
             # First compare file sizes
-            if file1.stat().st_size != file2.stat().st_size:
+            size = os.stat(file1).st_size
+            if size != os.stat(file2).st_size:
                 return False
 
-            # For small files, direct content comparison may be faster
-            if file1.stat().st_size < self.chunk_size:
-                with open(file1, "rb") as f1, open(file2, "rb") as f2:
-                    return f1.read() == f2.read()
-
-            # For large files, compare hashes
-            hash1 = self.calculate_file_hash(file1)
-            hash2 = self.calculate_file_hash(file2)
-
-            return hash1 == hash2
+            return compare_file_contents(
+                file1, file2, self.chunk_size, size, self.prefilter, self.engine, stats
+            )
         except Exception as e:
             self.error_files.append((rel_path, str(e)))
             return False
+        finally:
+            self._account(stats)
 
-    def process_file_comparison(self, rel_path: str, file1: Path, file2: Path) -> Tuple[str, bool]:
-        """Process a single file comparison, can be called by parallel processor"""
-        is_identical = self.compare_files(rel_path, file1, file2)
-        file_size = file1.stat().st_size
-        self.total_size_processed += file_size
-
-        return rel_path, is_identical
+    def _account(self, stats) -> None:
+        """Add the bytes read and read/hash times of a ReadStats or FileResult to the totals"""
+        self.total_size_processed += stats.bytes_read
+        self.read_time += stats.read_time
+        self.hash_time += stats.hash_time
 
-    def compare(self) -> Dict:
+    def _find_moves(
+        self,
+        missing: List[str],
+        extra: List[str],
+        files_dict1: Dict[str, FileStat],
+        files_dict2: Dict[str, FileStat],
+    ) -> Iterator[FileResult]:
         """
-        Execute directory comparison
+        Pair missing and extra files with identical content as moves
 
-        Returns a dictionary containing comparison results
+        Files are first indexed by size, and only sizes present on both sides are
+        digested, so the cost scales with the number of size collisions rather than
+        the size of the tree. Empty files are never paired. Yields a "moved" result
+        per pair (rel_path in dir2, moved_from in dir1), and a candidate that could
+        not be read keeps its "missing" or "extra" verdict, with the read error.
         """
-        self.start_time = time.time()
+        by_size = defaultdict(lambda: ([], []))
+        for rel_path in missing:
+            if files_dict1[rel_path].size:
+                by_size[files_dict1[rel_path].size][0].append(rel_path)
+        for rel_path in extra:
+            if files_dict2[rel_path].size:
+                by_size[files_dict2[rel_path].size][1].append(rel_path)
+
+        candidates = [
+            (path, side)
+            for old_paths, new_paths in by_size.values()
+            if old_paths and new_paths
+            for side, paths in ((self.dir1, old_paths), (self.dir2, new_paths))
+            for path in paths
+        ]
+        if not candidates:
+            return
+
+        def digest(candidate: Tuple[str, str]) -> Tuple[Optional[str], Optional[str], ReadStats]:
+            rel_path, base = candidate
+            stats = ReadStats()
+            if base == self.dir1 and self.against_manifest:
+                file_hash = self._reference_digests.get(rel_path)
+                return file_hash, None if file_hash else "No digest in manifest", stats
+            try:
+                path = os.path.join(base, rel_path)
+                file_hash = file_digest(path, self.chunk_size, self.hash_algorithm, stats=stats)
+                return file_hash, None, stats
+            except OSError as e:
+                return None, str(e), stats
+
+        print(f"Checking {len(candidates)} missing/extra files for moves...")
+        by_digest = defaultdict(lambda: ([], []))
+        with ThreadPoolExecutor(max_workers=self.small_lane_workers) as executor:
+            for (rel_path, base), (file_hash, error, stats) in zip(
+                candidates, executor.map(digest, candidates)
+            ):
+                self._account(stats)
+                if error is not None:
+                    status = "missing" if base == self.dir1 else "extra"
+                    yield FileResult(rel_path, status, error)
+                    continue
+                by_digest[file_hash][0 if base == self.dir1 else 1].append(rel_path)
+
+        for file_hash, (old_paths, new_paths) in by_digest.items():
+            # Prefer pairing files that kept their name
+            new_by_name = defaultdict(list)
+            for new_path in new_paths:
+                new_by_name[os.path.basename(new_path)].append(new_path)
+            unpaired = []
+            for old_path in old_paths:
+                same_name = new_by_name.get(os.path.basename(old_path))
+                if same_name:
+                    new_path = same_name.pop()
+                    new_paths.remove(new_path)
+                    yield FileResult(new_path, "moved", None, file_hash, file_hash, old_path)
+                else:
+                    unpaired.append(old_path)
+            for old_path, new_path in zip(unpaired, new_paths):
+                yield FileResult(new_path, "moved", None, file_hash, file_hash, old_path)
+
+    def _duplicate_candidates(
+        self, files_dict1: Dict[str, FileStat], files_dict2: Dict[str, FileStat]
+    ) -> Dict[Tuple[int, str], int]:
+        """
+        Return the files that may have a duplicate within their own tree
 
-        # Get file lists for both directories
-        print(f"Scanning directory: {self.dir1}")
-        files_dict1 = self.get_files_dict(self.dir1)
-        print(f"Scanning directory: {self.dir2}")
-        files_dict2 = self.get_files_dict(self.dir2)
+        Only non-empty files whose size occurs more than once in the same tree can
+        be duplicates. Returns {(side, rel_path): size} with side 0 for dir1 and
+        1 for dir2, covering both trees for every such size.
+        """
+        sizes = [defaultdict(int), defaultdict(int)]
+        for side, files_dict in enumerate((files_dict1, files_dict2)):
+            for stat in files_dict.values():
+                sizes[side][stat.size] += 1
+        colliding = {
+            size
+            for side_sizes in sizes
+            for size, count in side_sizes.items()
+            if size and count > 1
+        }
 
-        # Find files in dir1 that are missing in dir2
-        self.missing_files = [f for f in files_dict1.keys() if f not in files_dict2]
+        return {
+            (side, rel_path): stat.size
+            for side, files_dict in enumerate((files_dict1, files_dict2))
+            for rel_path, stat in files_dict.items()
+            if stat.size in colliding
+        }
 
-        # Find files in dir2 that are not in dir1
-        self.extra_files = [f for f in files_dict2.keys() if f not in files_dict1]
+    def _find_duplicates(
+        self, candidates: Dict[Tuple[int, str], int], known_digests: Dict[Tuple[int, str], str]
+    ) -> List[Dict]:
+        """
+        Build a content index of the candidate files and return duplicate clusters
+
+        Candidates go through three stages, size bucket, partial hash of the first
+        block, then full hash, and each stage only keeps groups that can still hold
+        a duplicate within one tree. Full digests computed during the comparison
+        (common files that were read, or found in the cache) are reused instead of
+        reading the file again, and size buckets whose digests are all known skip
+        the partial hash. Missing and extra files, and common files decided without
+        reading them (sizes, --since, quick mode), are read here.
+
+        Returns: Clusters sorted by wasted bytes, each a dict with size, digest,
+                 files1, files2 and wasted_bytes (bytes used by copies beyond the
+                 first in each tree)
+        """
+        bases = (self.dir1, self.dir2)
+
+        def has_duplicates(keys: List[Tuple[int, str]]) -> bool:
+            sides = [side for side, _ in keys]
+            return sides.count(0) > 1 or sides.count(1) > 1
+
+        def refine(groups: Dict, stage: Callable) -> Dict:
+            """
+            Split each group by a per-file key, keeping groups that may hold duplicates
+
+            stage returns (value, ReadStats) per file, a None value drops the file
+            """
+            keys = [key for group in groups.values() if has_duplicates(group) for key in group]
+            refined = defaultdict(list)
+            with ThreadPoolExecutor(max_workers=self.small_lane_workers) as executor:
+                for key, (value, stats) in zip(keys, executor.map(stage, keys)):
+                    self._account(stats)
+                    if value is not None:
+                        refined[(candidates[key], value)].append(key)
+            return refined
+
+        def partial_hash(key: Tuple[int, str]) -> Tuple[Optional[str], ReadStats]:
+            side, rel_path = key
+            stats = ReadStats()
+            if candidates[key] <= PREFILTER_BLOCK_SIZE:
+                # The partial hash already covers the whole file
+                return "full", stats
+            try:
+                path = os.path.join(bases[side], rel_path)
+                return file_digest(
+                    path, self.chunk_size, self.hash_algorithm, PREFILTER_BLOCK_SIZE, stats
+                ), stats
+            except OSError:
+                return None, stats
+
+        def full_hash(key: Tuple[int, str]) -> Tuple[Optional[str], ReadStats]:
+            stats = ReadStats()
+            if key in known_digests:
+                return known_digests[key], stats
+            side, rel_path = key
+            try:
+                path = os.path.join(bases[side], rel_path)
+                return file_digest(path, self.chunk_size, self.hash_algorithm, stats=stats), stats
+            except OSError:
+                return None, stats
+
+        by_size = defaultdict(list)
+        for key, size in candidates.items():
+            by_size[size].append(key)
+        known = {
+            size: keys for size, keys in by_size.items()
+            if all(key in known_digests for key in keys)
+        }
+        for size in known:
+            del by_size[size]
+
+        print(f"Indexing {len(candidates)} files for duplicate content...")
+        groups = refine(by_size, partial_hash)
+        groups.update(((size, None), keys) for size, keys in known.items())
+        clusters = []
+        for (size, digest), keys in refine(groups, full_hash).items():
+            if not has_duplicates(keys):
+                continue
+            files1 = sorted(rel_path for side, rel_path in keys if side == 0)
+            files2 = sorted(rel_path for side, rel_path in keys if side == 1)
+            wasted = size * (max(len(files1) - 1, 0) + max(len(files2) - 1, 0))
+            clusters.append({
+                "size": size,
+                "digest": digest,
+                "files1": files1,
+                "files2": files2,
+                "wasted_bytes": wasted,
+            })
+
+        clusters.sort(key=lambda cluster: cluster["wasted_bytes"], reverse=True)
+        return clusters
+
+    def _plan_common_files(
+        self,
+        common_files: List[str],
+        files_dict1: Dict[str, FileStat],
+        files_dict2: Dict[str, FileStat],
+        pending: List[tuple],
+        cache: Optional[HashCache] = None,
+        previous: Optional[Dict[str, ManifestEntry]] = None,
+    ) -> Iterator[FileResult]:
+        """
+        Decide common files that do not need their content read
+
+        Files whose sizes differ are different. Files whose stat tuples on both
+        sides match the previous run manifest keep their previous verdict. In quick
+        mode, files with equal size and mtime are identical unless picked for sampled
+        verification. With a cache, files whose stat tuples match cached entries on
+        both sides are classified from their digests. Against a tree manifest, the
+        reference digest is taken from the manifest.
+        Results for these are yielded, the remaining files are appended to pending
+        as (rel_path, size, stat1, stat2, digest1, digest2) where a digest is only
+        set if it is already known.
+        """
+        for rel_path in common_files:
+            st1, st2 = files_dict1[rel_path], files_dict2[rel_path]
+            if st1.size != st2.size:
+                yield FileResult(rel_path, "different")
+                continue
 
-        # Find files present in both directories that need content comparison
-        common_files = [f for f in files_dict1.keys() if f in files_dict2]
-        self.total_files_processed = (
-            len(common_files) + len(self.missing_files) + len(self.extra_files)
-        )
+            entry = previous.get(rel_path) if previous else None
+            if (
+                entry is not None
+                and entry.stat1 == (st1.size, st1.mtime_ns, st1.inode)
+                and entry.stat2 == (st2.size, st2.mtime_ns, st2.inode)
+            ):
+                yield FileResult(rel_path, entry.status, None, entry.digest1, entry.digest2)
+                continue
 
-        print(f"Starting comparison of {len(common_files)} common files...")
+            if (
+                self.quick
+                and st1.mtime_ns == st2.mtime_ns
+                and random.random() * 100 >= self.verify_sample
+            ):
+                yield FileResult(rel_path, "identical")
+                continue
 
-        # Use parallel processing to speed up file comparison
-        if common_files:  # Only start parallel processing if there are common files
-            # Create progress bar
-            progress = None
-            if self.show_progress:
-                progress = ProgressBar(
-                    len(common_files), prefix="Progress:", suffix="Complete", length=50
+            digest1 = digest2 = None
+            if self.against_manifest:
+                digest1 = self._reference_digests.get(rel_path)
+                if digest1 is None:
+                    yield FileResult(rel_path, "error", "No digest in manifest")
+                    continue
+            elif cache is not None:
+                digest1 = cache.get(
+                    os.path.join(self.dir1, rel_path), st1.size, st1.mtime_ns, st1.inode
+                )
+            if cache is not None:
+                digest2 = cache.get(
+                    os.path.join(self.dir2, rel_path), st2.size, st2.mtime_ns, st2.inode
                 )
+                # Differing files are still read when their blocks are mapped
+                if digest1 is not None and digest2 is not None and (
+                    digest1 == digest2 or not self.diff_block_size
+                ):
+                    status = "identical" if digest1 == digest2 else "different"
+                    yield FileResult(rel_path, status, None, digest1, digest2)
+                    continue
 
-            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
-                # Submit all comparison tasks to the process pool
-                future_to_file = {
-                    executor.submit(
-                        self.compare_files, rel_path, files_dict1[rel_path], files_dict2[rel_path]
-                    ): rel_path
-                    for rel_path in common_files
-                }
+            pending.append((rel_path, st1.size, st1, st2, digest1, digest2))
+
+    def _make_batches(self, pending: List[tuple]) -> Iterator[List[tuple]]:
+        """Group pending files into worker batches bounded by file count and total size"""
+        batch = []
+        batch_bytes = 0
+        for item in pending:
+            size = item[1]
+            if batch and (
+                len(batch) >= self.batch_max_files
+                or batch_bytes + size > self.batch_max_bytes
+            ):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(item)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    def _item_devices(self, item: tuple) -> Tuple[int, ...]:
+        """Return the devices a pending file pair is read from"""
+        if self.against_manifest:
+            # The reference side comes from the manifest and is never read
+            return (item[3].dev,)
+        return tuple(sorted({item[2].dev, item[3].dev}))
+
+    def _needs_digest(self, item: tuple) -> bool:
+        """Return whether a pending file pair is a candidate of the duplicate index"""
+        keys = self._duplicate_keys
+        return (0, item[0]) in keys or (1, item[0]) in keys
+
+    def _group_batches(
+        self, pending: List[tuple]
+    ) -> Dict[Tuple[int, ...], Iterator[List[tuple]]]:
+        """
+        Group pending files by the devices they are read from and batch each group
+
+        Duplicate index candidates are batched after the other files of a group,
+        so that only their batches are digested instead of streamed.
+        """
+        groups = defaultdict(list)
+        for item in pending:
+            groups[self._item_devices(item)].append(item)
+        if self._duplicate_keys:
+            for items in groups.values():
+                items.sort(key=self._needs_digest)
+        return {devices: self._make_batches(items) for devices, items in groups.items()}
+
+    def _device_limit(self, dev: int) -> Optional[int]:
+        """Return the number of batches that may read from a device at once, None for no limit"""
+        if dev in self.device_workers:
+            return self.device_workers[dev]
+        if self.detect_rotational and is_rotational_device(dev):
+            return 1
+        return self.per_device_workers
+
+    def _compare_common_files(
+        self,
+        total: int,
+        pending: List[tuple],
+        cache: Optional[HashCache] = None,
+    ) -> Iterator[FileResult]:
+        """
+        Compare pending common files in parallel batches
+
+        Small and large files run in separate lanes whose in-flight limits tune
+        themselves from observed throughput. Results are yielded in completion order,
+        and only a bounded number of batches is in flight at any time so memory
+        stays flat on huge trees.
+        """
+        # Files already decided without reading them count as done
+        done = total - len(pending)
+
+        # Create progress bar, weighted by the bytes left to compare
+        progress = None
+        if self.show_progress:
+            progress = ProgressBar(
+                total, prefix="Progress:", suffix="Complete", length=50,
+                total_bytes=sum(item[1] for item in pending),
+            )
+            progress.update(done)
+
+        if not pending:
+            if progress:
+                progress.close()
+            return
+
+        # Small files are latency bound and go to a wide thread pool, large files are
+        # bandwidth bound and go to a narrow process pool
+        small = [item for item in pending if item[1] < self.large_file_threshold]
+        large = [item for item in pending if item[1] >= self.large_file_threshold]
+        small_workers = self.small_lane_workers or min(32, (os.cpu_count() or 1) * 4)
+        # A few readers saturate a disk with large files, more only add seeks and memory
+        large_workers = self.large_lane_workers or min(4, self.max_workers or os.cpu_count() or 1)
+
+        # Concurrency limits per device, None for unlimited
+        device_limits = {}
+        device_in_flight = defaultdict(int)
+        for item in pending:
+            for dev in self._item_devices(item):
+                if dev not in device_limits:
+                    device_limits[dev] = self._device_limit(dev)
+
+        def devices_free(devices: Tuple[int, ...]) -> bool:
+            return all(
+                device_limits[dev] is None or device_in_flight[dev] < device_limits[dev]
+                for dev in devices
+            )
+
+        phases = self.phases
+        phases.enter("pool")
+        with contextlib.ExitStack() as stack:
+            if progress:
+                # Closed last, once the pools are shut down
+                stack.callback(progress.close)
+            lanes = []
+            if small:
+                executor = stack.enter_context(ThreadPoolExecutor(max_workers=small_workers))
+                lanes.append(
+                    _Lane("small", executor, small_workers, self._group_batches(small), False)
+                )
+            if large:
+                # Worker threads, the progress ticker and metrics threads are running,
+                # forking them could deadlock the children
+                executor = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=large_workers, mp_context=_process_context()
+                ))
+                # One batch per process, a queued batch would only hold more of a large file
+                lanes.append(_Lane(
+                    "large", executor, large_workers, self._group_batches(large), True,
+                    max_limit=large_workers,
+                ))
+            self.lanes = lanes
+
+            # Batches go to stateless workers, the stat results stay here
+            in_flight = {}
+
+            def fill_lanes() -> None:
+                phase = phases.enter("dispatch")
+                for lane in lanes:
+                    job = lane.next_batch(devices_free)
+                    while job is not None:
+                        devices, batch = job
+                        # Digests are needed for the cache, the reference manifest and
+                        # the duplicate index, which then does not read the files again
+                        needs_digests = (
+                            cache is not None
+                            or self.against_manifest
+                            or any(self._needs_digest(item) for item in batch)
+                        )
+                        # Taken before submitting, a thread may start on it right away
+                        submitted = time.time()
+                        future = lane.executor.submit(
+                            _compare_batch,
+                            self.dir1,
+                            self.dir2,
+                            [(item[0], item[1], item[4], item[5]) for item in batch],
+                            self.chunk_size,
+                            self.hash_algorithm if needs_digests else None,
+                            self.prefilter,
+                            self.engine,
+                            self.diff_block_size,
+                        )
+                        lane.in_flight += 1
+                        for dev in devices:
+                            device_in_flight[dev] += 1
+                        in_flight[future] = (lane, devices, batch, submitted)
+                        job = lane.next_batch(devices_free)
+                phases.enter(phase)
+
+            fill_lanes()
+
+            # Collect results as they complete
+            while in_flight:
+                phases.enter("wait")
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                phases.enter("collect")
+                for future in finished:
+                    lane, devices, batch, submitted = in_flight.pop(future)
+                    nbytes = sum(item[1] for item in batch)
+                    lane.record(len(batch), nbytes)
+                    for dev in devices:
+                        device_in_flight[dev] -= 1
 
-                # Collect results
-                for i, future in enumerate(future_to_file):
-                    rel_path = future_to_file[future]
                     try:
-                        is_identical = future.result()
-                        if is_identical:
-                            self.identical_files.append(rel_path)
-                        else:
-                            self.different_files.append(rel_path)
+                        results, (pid, tid, started, ended) = future.result()
                     except Exception as e:
-                        self.error_files.append((rel_path, str(e)))
+                        results = [FileResult(item[0], "error", str(e)) for item in batch]
+                    else:
+                        # Time outside the worker was spent queued, pickling or in transit
+                        collected = time.time()
+                        # Clamped, the worker and parent clocks are read separately
+                        transit = max(0.0, (collected - submitted) - (ended - started))
+                        self.worker_times["busy"] += ended - started
+                        self.worker_times["transit"] += transit
+                        phases.add_span(
+                            f"{lane.name} batch", started, ended, pid, tid, "worker",
+                            files=len(batch), bytes=nbytes, transit=transit,
+                        )
+                    lane.account(len(batch), sum(result.bytes_read for result in results))
+
+                    for item, result in zip(batch, results):
+                        rel_path, _, st1, st2, _, _ = item
+                        if cache is not None and result.status != "error":
+                            if not self.against_manifest:
+                                cache.put(
+                                    os.path.join(self.dir1, rel_path),
+                                    st1.size, st1.mtime_ns, st1.inode, result.digest1,
+                                )
+                            cache.put(
+                                os.path.join(self.dir2, rel_path),
+                                st2.size, st2.mtime_ns, st2.inode, result.digest2,
+                            )
+                        yield result
+
+                    done += len(batch)
 
                     # Update progress bar
                     if progress:
-                        progress.update(i + 1)
-                    elif (i + 1) % 100 == 0 or (i + 1) == len(common_files):
+                        progress.update(done, nbytes)
+                    elif self.log_progress:
                         # Fall back to simple progress output if no progress bar
-                        print(f"Compared: {i + 1}/{len(common_files)} files")
+                        print(f"Compared: {done}/{total} files")
+
+                fill_lanes()
+
+            # Leaving the stack waits for the pools to shut down
+            phases.enter("pool")
+        phases.enter("collect")
+
+    def _load_reference_manifest(self) -> Dict[str, FileStat]:
+        """
+        Load the reference side from the dir1 tree manifest
+
+        The manifest's digests are kept in _reference_digests and its hash algorithm
+        replaces hash_algorithm, so digests of dir2 are comparable.
+
+        Returns: {relative_path: FileStat}, the same shape as a scanned tree
+        """
+        header, entries = read_manifest(self.dir1)
+        if header.get("kind") != TREE_MANIFEST:
+            raise ManifestError(f"Not a tree manifest: {self.dir1}")
+        algorithm = header.get("hash_algorithm", DEFAULT_HASH_ALGORITHM)
+        if not is_available(algorithm):
+            raise ManifestError(f"Manifest hash algorithm {algorithm} is not installed")
+        self.hash_algorithm = algorithm
+
+        files_dict = {}
+        self._reference_digests = {}
+        for entry in entries:
+            if self.ignore_matcher.match_path(entry.rel_path):
+                continue
+            size, mtime_ns, inode = entry.stat1
+            # The device is never used, the reference side is not read
+            files_dict[entry.rel_path] = FileStat(size, mtime_ns, inode, -1)
+            self._reference_digests[entry.rel_path] = entry.digest1
+        return files_dict
+
+    def _load_previous_manifest(self) -> Dict[str, ManifestEntry]:
+        """
+        Load the verdicts of common files from the since_manifest run manifest
+
+        Verdicts do not depend on the hash algorithm, but digests do: the digests of
+        a manifest made with another algorithm are dropped, so they are neither
+        mixed with new digests nor carried into the next manifest.
+        """
+        header, entries = read_manifest(self.since_manifest)
+        if header.get("kind") != RUN_MANIFEST:
+            raise ManifestError(f"Not a run manifest: {self.since_manifest}")
+        same_algorithm = header.get("hash_algorithm") == self.hash_algorithm
+        return {
+            entry.rel_path: entry if same_algorithm else entry._replace(digest1=None, digest2=None)
+            for entry in entries
+            if entry.status in ("identical", "different")
+            and entry.stat1 is not None
+            and entry.stat2 is not None
+        }
 
+    def _manifest_entry(
+        self,
+        result: FileResult,
+        files_dict1: Dict[str, FileStat],
+        files_dict2: Dict[str, FileStat],
+    ) -> ManifestEntry:
+        """Build the run manifest record of a result"""
+        stat1 = stat2 = None
+        if result.status != "extra":
+            st = files_dict1.get(result.moved_from or result.rel_path)
+            stat1 = (st.size, st.mtime_ns, st.inode) if st else None
+        if result.status != "missing":
+            st = files_dict2.get(result.rel_path)
+            stat2 = (st.size, st.mtime_ns, st.inode) if st else None
+        return ManifestEntry(
+            result.rel_path, result.status, stat1, stat2,
+            result.digest1, result.digest2, result.moved_from,
+        )
+
+    def iter_compare(self) -> Iterator[FileResult]:
+        """
+        Execute directory comparison, yielding a FileResult per file as soon as it is known
+
+        Missing and extra files are yielded first, followed by common files in
+        completion order. Results are not accumulated, so memory stays bounded
+        regardless of the number of files. The time spent in each phase, including
+        the time the caller takes to consume results ("report"), is recorded in
+        phases.
+        """
+        self.start_time = time.time()
+        self.end_time = None
+        self.scan_errors = []
+        self.total_size_processed = 0
+        self.read_time = 0.0
+        self.hash_time = 0.0
+        self.phases = phases = PhaseTimer(self.trace)
+        phases.enter("collect")
+        self.scan_times = {}
+        self.worker_times = {"busy": 0.0, "transit": 0.0}
+        self.status_counts = Counter(dict.fromkeys(RESULT_STATUSES, 0))
+        self.lanes = []
+        self.total_files_processed = 0
+
+        # Verdicts of the previous run, reused for files whose stat did not change
+        previous = {}
+        if self.since_manifest:
+            with phases.span("manifest"):
+                previous = self._load_previous_manifest()
+
+        if self.against_manifest:
+            print(f"Loading manifest: {self.dir1}")
+            with phases.span("scan"):
+                started = time.time()
+                files_dict1 = self._load_reference_manifest()
+                self.scan_times[self.dir1] = time.time() - started
+                print(f"Scanning directory: {self.dir2}")
+                (files_dict2,) = self.scan_trees([self.dir2])
+        else:
+            # Scan both directories at the same time
+            print(f"Scanning directory: {self.dir1}")
+            print(f"Scanning directory: {self.dir2}")
+            with phases.span("scan"):
+                files_dict1, files_dict2 = self.scan_trees([self.dir1, self.dir2])
+
+        # Common files among the candidates are digested by the comparison, and
+        # those digests are reused by the duplicate index
+        self.duplicate_files = []
+        candidates = {}
+        known_digests = {}
+        if self.find_duplicates:
+            # Against a manifest only the live tree can be indexed
+            with phases.span("duplicates"):
+                candidates = self._duplicate_candidates(
+                    {} if self.against_manifest else files_dict1, files_dict2
+                )
+        self._duplicate_keys = set(candidates)
+
+        writer = None
+        if self.save_manifest:
+            writer = ManifestWriter(self.save_manifest, RUN_MANIFEST, {
+                "dir1": self.dir1,
+                "dir2": self.dir2,
+                "hash_algorithm": self.hash_algorithm,
+                "created": datetime.now().isoformat(timespec="seconds"),
+            })
+
+        completed = False
+        try:
+            for result in self._iter_results(files_dict1, files_dict2, previous):
+                self._account(result)
+                self.status_counts[result.status] += 1
+                if result.status != "error":
+                    if candidates:
+                        keys = ((0, result.moved_from or result.rel_path), (1, result.rel_path))
+                        for key, digest in zip(keys, (result.digest1, result.digest2)):
+                            if digest is not None and key in candidates:
+                                known_digests[key] = digest
+                    if writer is not None:
+                        writer.write(self._manifest_entry(result, files_dict1, files_dict2))
+                # Time spent by the caller on the result is charged to "report"
+                phase = phases.enter("report")
+                yield result
+                phases.enter(phase)
+            completed = True
+        finally:
+            # An interrupted run keeps the previous manifest
+            if writer is not None:
+                writer.close(commit=completed)
+
+        if candidates:
+            with phases.span("duplicates"):
+                self.duplicate_files = self._find_duplicates(candidates, known_digests)
+
+        phases.enter(None)
         self.end_time = time.time()
 
+    def _iter_results(
+        self,
+        files_dict1: Dict[str, FileStat],
+        files_dict2: Dict[str, FileStat],
+        previous: Dict[str, ManifestEntry],
+    ) -> Iterator[FileResult]:
+        """Yield the results of comparing two scanned trees"""
+        phases = self.phases
+        with phases.span("set_diff"):
+            # Find files present in both directories that need content comparison
+            common_files = [f for f in files_dict1.keys() if f in files_dict2]
+            self.total_files_processed = (
+                len(files_dict1) + len(files_dict2) - len(common_files)
+            )
+            # Files only present on one side
+            missing = [f for f in files_dict1.keys() if f not in files_dict2]
+            extra = [f for f in files_dict2.keys() if f not in files_dict1]
+
+        # Paths that could not be scanned
+        for rel_path, error in self.scan_errors:
+            yield FileResult(rel_path, "error", error)
+
+        # Missing and extra files optionally paired up as moves
+        moved = {}
+        unreadable = set()  # Move candidates that could not be read, already reported
+        if self.detect_moves and missing and extra:
+            with phases.span("moves"):
+                for result in self._find_moves(missing, extra, files_dict1, files_dict2):
+                    if result.status == "moved":
+                        moved[result.moved_from] = result.rel_path
+                    else:
+                        unreadable.add(result.rel_path)
+                    yield result
+        moved_to = set(moved.values())
+
+        # Files in dir1 that are missing in dir2
+        for rel_path in missing:
+            if rel_path not in moved and rel_path not in unreadable:
+                yield FileResult(rel_path, "missing")
+
+        # Files in dir2 that are not in dir1
+        for rel_path in extra:
+            if rel_path not in moved_to and rel_path not in unreadable:
+                yield FileResult(rel_path, "extra")
+
+        print(f"Starting comparison of {len(common_files)} common files...")
+
+        # The cache is opened per run and kept off self
+        cache = None
+        if self.cache_path:
+            cache = HashCache(self.cache_path, self.cache_max_entries, self.hash_algorithm)
+        try:
+            # Resolve size mismatches and unchanged files first, only the rest need reading
+            pending = []
+            with phases.span("plan"):
+                yield from self._plan_common_files(
+                    common_files, files_dict1, files_dict2, pending, cache, previous
+                )
+            if cache is not None:
+                print(f"Digest cache: {cache.hits} hits, {cache.misses} misses")
+
+            if common_files:  # Only start parallel processing if there are common files
+                yield from self._compare_common_files(len(common_files), pending, cache)
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def compare(self, on_result: Optional[Callable[[FileResult], None]] = None) -> Dict:
+        """
+        Execute directory comparison
+
+        Args:
+            on_result: Optional callback invoked with each FileResult as soon as it is known
+
+        Returns a dictionary containing comparison results
+        """
+        self.different_files = []
+        self.missing_files = []
+        self.extra_files = []
+        self.identical_files = []
+        self.error_files = []
+        self.moved_files = []
+        self.block_diffs = {}
+
+        buckets = {
+            "identical": self.identical_files,
+            "different": self.different_files,
+            "missing": self.missing_files,
+            "extra": self.extra_files,
+        }
+        for result in self.iter_compare():
+            if result.status == "error":
+                self.error_files.append((result.rel_path, result.error))
+            elif result.status == "moved":
+                self.moved_files.append((result.moved_from, result.rel_path))
+            else:
+                buckets[result.status].append(result.rel_path)
+            if result.diff_blocks is not None:
+                self.block_diffs[result.rel_path] = {
+                    "block_size": self.diff_block_size,
+                    "runs": result.diff_blocks,
+                    "differing_blocks": sum(count for _, count in result.diff_blocks),
+                    "differing_bytes": result.diff_bytes,
+                }
+
+            if on_result is not None:
+                on_result(result)
+
         # Return comparison results
+        return self.get_results()
+
+    def get_results(self) -> Dict:
+        """Return the results of the last comparison as a dictionary"""
         return {
             "identical_files": self.identical_files,
             "different_files": self.different_files,
             "missing_files": self.missing_files,
             "extra_files": self.extra_files,
+            "moved_files": self.moved_files,
+            "duplicate_files": self.duplicate_files,
+            "block_diffs": self.block_diffs,
             "error_files": self.error_files,
             "total_files_processed": self.total_files_processed,
             "total_size_processed": self.total_size_processed,
-            "time_elapsed": self.end_time - self.start_time,
+            "read_time": self.read_time,
+            "hash_time": self.hash_time,
+            "time_elapsed": self.end_time - self.start_time if self.end_time else 0,
+            "phase_times": dict(self.phases.times),
+            "scan_times": dict(self.scan_times),
+            "worker_times": dict(self.worker_times),
         }
 
+    def write_trace(self, path: str) -> None:
+        """Save the spans of the last comparison, recorded with trace=True, as a Chrome trace"""
+        if self.phases.events is None:
+            raise ValueError("Tracing is not enabled")
+        write_chrome_trace(path, self.phases.events)
+
     def generate_text_report(self, results: Dict = None) -> str:
         """Generate a text comparison report"""
         if results is None:
-            results = {
-                "identical_files": self.identical_files,
-                "different_files": self.different_files,
-                "missing_files": self.missing_files,
-                "extra_files": self.extra_files,
-                "error_files": self.error_files,
-                "total_files_processed": self.total_files_processed,
-                "total_size_processed": self.total_size_processed,
-                "time_elapsed": self.end_time - self.start_time if self.end_time else 0,
-            }
+            results = self.get_results()
 
         # Calculate processing speed
         speed = (
@@ -319,6 +2539,7 @@ class DirectoryComparer:
             if results["time_elapsed"] > 0
             else 0
         )
+        moved_files = results.get("moved_files", [])
 
         # Generate report
         report = [
@@ -331,19 +2552,26 @@ class DirectoryComparer:
             f"Total data processed: {results['total_size_processed'] / (1024*1024):.2f} MB",
             f"Processing time: {results['time_elapsed']:.2f} seconds",
             f"Processing speed: {speed / (1024*1024):.2f} MB/s",
+            f"Read time: {results.get('read_time', 0):.2f} seconds, "
+            f"hash time: {results.get('hash_time', 0):.2f} seconds (summed over workers)",
+            f"Phase times: {format_phase_times(results)}",
             "-" * 80,
             f"Identical files: {len(results['identical_files'])}",
             f"Files with different content: {len(results['different_files'])}",
             f"Missing files (in folder1 but not in folder2): {len(results['missing_files'])}",
             f"Extra files (in folder2 but not in folder1): {len(results['extra_files'])}",
+            f"Moved files: {len(moved_files)}",
             f"Error files: {len(results['error_files'])}",
         ]
 
         # Add detailed list of different files
+        block_diffs = results.get("block_diffs", {})
         if results["different_files"]:
             report.extend(["-" * 80, "Files with different content:", "-" * 80])
             for file in sorted(results["different_files"]):
                 report.append(f"  {file}")
+                if file in block_diffs:
+                    report.append(f"    {format_block_diff(block_diffs[file])}")
 
         # Add list of missing files
         if results["missing_files"]:
@@ -357,6 +2585,30 @@ class DirectoryComparer:
             for file in sorted(results["extra_files"]):
                 report.append(f"  {file}")
 
+        # Add list of moved files
+        if moved_files:
+            report.extend(["-" * 80, "Moved files (folder1 path -> folder2 path):", "-" * 80])
+            for old_path, new_path in sorted(moved_files):
+                report.append(f"  {old_path} -> {new_path}")
+
+        # Add duplicate content clusters
+        duplicate_files = results.get("duplicate_files", [])
+        if duplicate_files:
+            wasted = sum(cluster["wasted_bytes"] for cluster in duplicate_files)
+            report.extend([
+                "-" * 80,
+                f"Duplicate content clusters: {len(duplicate_files)} "
+                f"({wasted / (1024*1024):.2f} MB wasted)",
+                "-" * 80,
+            ])
+            for cluster in duplicate_files:
+                report.append(
+                    f"  {cluster['size']} bytes, "
+                    f"{cluster['wasted_bytes'] / (1024*1024):.2f} MB wasted:"
+                )
+                report.extend(f"    folder1: {file}" for file in cluster["files1"])
+                report.extend(f"    folder2: {file}" for file in cluster["files2"])
+
         # Add list of error files
         if results["error_files"]:
             report.extend(["-" * 80, "Error files:", "-" * 80])
@@ -375,19 +2627,50 @@ class DirectoryComparer:
 
         return "\n".join(report)
 
-    def generate_html_report(self, results: Dict = None) -> str:
-        """Generate an HTML comparison report"""
+    def _report_rows(self, results: Dict) -> Dict[str, List[str]]:
+        """Return the file list entries of a scalable HTML report, one string per row"""
+        block_diffs = results.get("block_diffs", {})
+        return {
+            "different": [
+                f"{file}  ({format_block_diff(block_diffs[file])})"
+                if file in block_diffs else file
+                for file in sorted(results["different_files"])
+            ],
+            "missing": sorted(results["missing_files"]),
+            "extra": sorted(results["extra_files"]),
+            "moved": [
+                f"{old_path} \u2192 {new_path}"
+                for old_path, new_path in sorted(results.get("moved_files", []))
+            ],
+            "duplicate": [
+                f"{cluster['size']} bytes, "
+                f"{cluster['wasted_bytes'] / (1024*1024):.2f} MB wasted: "
+                + ", ".join(
+                    [f"folder1: {file}" for file in cluster["files1"]]
+                    + [f"folder2: {file}" for file in cluster["files2"]]
+                )
+                for cluster in results.get("duplicate_files", [])
+            ],
+            "error": [f"{file}: {error}" for file, error in results["error_files"]],
+        }
+
+    def generate_html_report(self, results: Dict = None, mode: str = "auto") -> str:
+        """
+        Generate an HTML comparison report
+
+        Args:
+            results: Results to report, None for those of the last comparison
+            mode: "inline" renders every file list as HTML, "scalable" embeds them as
+                  compact JSON shown through a searchable, paginated, virtually
+                  scrolled list, and "compressed" also gzip-compresses the JSON.
+                  "auto" picks inline up to HTML_INLINE_LIMIT entries, else scalable
+
+        Returns: The HTML document
+        """
+        if mode not in HTML_MODES:
+            raise ValueError(f"Unknown HTML report mode: {mode}")
         if results is None:
-            results = {
-                "identical_files": self.identical_files,
-                "different_files": self.different_files,
-                "missing_files": self.missing_files,
-                "extra_files": self.extra_files,
-                "error_files": self.error_files,
-                "total_files_processed": self.total_files_processed,
-                "total_size_processed": self.total_size_processed,
-                "time_elapsed": self.end_time - self.start_time if self.end_time else 0,
-            }
+            results = self.get_results()
 
         # Calculate processing speed
         speed = (
@@ -395,310 +2678,15 @@ class DirectoryComparer:
             if results["time_elapsed"] > 0
             else 0
         )
+        moved_files = results.get("moved_files", [])
 
-        # Create template
-        template_str = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Folder Comparison Report</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    margin: 0;
-                    padding: 20px;
-                    color: #333;
-                }
-                .container {
-                    max-width: 1200px;
-                    margin: 0 auto;
-                }
-                .header {
-                    background-color: #f8f9fa;
-                    padding: 20px;
-                    border-radius: 5px;
-                    margin-bottom: 20px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }
-                .summary {
-                    display: grid;
-                    grid-template-columns: 1fr 1fr;
-                    gap: 20px;
-                    margin-bottom: 30px;
-                }
-                .info-box {
-                    background-color: #fff;
-                    border-radius: 5px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                    padding: 15px;
-                }
-                .stats {
-                    display: flex;
-                    flex-wrap: wrap;
-                    gap: 10px;
-                    margin-bottom: 20px;
-                }
-                .stat-box {
-                    flex: 1;
-                    min-width: 150px;
-                    background-color: #fff;
-                    border-radius: 5px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                    padding: 15px;
-                    text-align: center;
-                }
-                .details {
-                    margin-top: 30px;
-                }
-                .section {
-                    margin-bottom: 30px;
-                }
-                h1 {
-                    color: #2c3e50;
-                    margin: 0 0 10px 0;
-                }
-                h2 {
-                    color: #3498db;
-                    margin: 0 0 15px 0;
-                    padding-bottom: 10px;
-                    border-bottom: 1px solid #eee;
-                }
-                h3 {
-                    color: #555;
-                }
-                .file-list {
-                    background-color: #f8f9fa;
-                    padding: 15px;
-                    border-radius: 5px;
-                    max-height: 300px;
-                    overflow-y: auto;
-                }
-                .file-list ul {
-                    list-style-type: none;
-                    padding: 0;
-                    margin: 0;
-                }
-                .file-list li {
-                    padding: 5px 10px;
-                    border-bottom: 1px solid #eee;
-                    word-break: break-all;
-                }
-                .different {
-                    background-color: #ffecb3;
-                }
-                .missing {
-                    background-color: #ffcdd2;
-                }
-                .extra {
-                    background-color: #c8e6c9;
-                }
-                .error {
-                    background-color: #ffcdd2;
-                    color: #d32f2f;
-                }
-                .timestamp {
-                    font-size: 0.8em;
-                    color: #777;
-                    margin-top: 5px;
-                }
-                .stat-title {
-                    font-size: 0.9em;
-                    color: #555;
-                    margin-bottom: 5px;
-                }
-                .stat-value{
-                    font-size: 1.6em;
-                    font-weight: bold;
-                }
-                .warning {
-                    color: #e74c3c;
-                }
-                .success {
-                    color: #27ae60;
-                }
-                .footer {
-                    margin-top: 50px;
-                    text-align: center;
-                    padding: 20px;
-                    color: #777;
-                    font-size: 0.9em;
-                    border-top: 1px solid #eee;
-                }
-                .footer a {
-                    color: #3498db;
-                    text-decoration: none;
-                }
-                .footer a:hover {
-                    text-decoration: underline;
-                }
-                .project-links {
-                    margin-top: 10px;
-                    display: flex;
-                    justify-content: center;
-                    gap: 20px;
-                }
-                .project-link {
-                    display: inline-flex;
-                    align-items: center;
-                    padding: 5px 10px;
-                    border-radius: 4px;
-                    background-color: #f8f9fa;
-                    transition: background-color 0.2s ease;
-                }
-                .project-link:hover {
-                    background-color: #e9ecef;
-                }
-                .project-link img {
-                    margin-right: 5px;
-                    width: 16px;
-                    height: 16px;
-                }
-                @media (max-width: 768px) {
-                    .summary {
-                        grid-template-columns: 1fr;
-                    }
-                    .stats {
-                        flex-direction: column;
-                    }
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Folder Comparison Report</h1>
-                    <div class="timestamp">Generated on: {{ timestamp }}</div>
-                </div>
-
-                <div class="summary">
-                    <div class="info-box">
-                        <h3>Folder 1</h3>
-                        <p>{{ dir1 }}</p>
-                    </div>
-                    <div class="info-box">
-                        <h3>Folder 2</h3>
-                        <p>{{ dir2 }}</p>
-                    </div>
-                </div>
-
-                <div class="stats">
-                    <div class="stat-box">
-                        <div class="stat-title">Total Files</div>
-                        <div class="stat-value">{{ total_files }}</div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-title">Identical Files</div>
-                        <div class="stat-value
-                            {% if identical_files_count == total_files %}success{% endif %}">
-                            {{ identical_files_count }}
-                        </div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-title">Different Files</div>
-                        <div class="stat-value
-                            {% if different_files_count > 0 %}warning{% endif %}">
-                            {{ different_files_count }}
-                        </div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-title">Missing Files</div>
-                        <div class="stat-value{% if missing_files_count > 0 %}warning{% endif %}">
-                            {{ missing_files_count }}
-                        </div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-title">Extra Files</div>
-                        <div class="stat-value{% if extra_files_count > 0 %}warning{% endif %}">
-                            {{ extra_files_count }}
-                        </div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-title">Error Files</div>
-                        <div class="stat-value{% if error_files_count > 0 %}warning{% endif %}">
-                            {{ error_files_count }}
-                        </div>
-                    </div>
-                </div>
-
-                <div class="info-box">
-                    <h3>Performance Metrics</h3>
-                    <p>Total data processed: {{ data_processed }} MB</p>
-                    <p>Processing time: {{ time_elapsed }} seconds</p>
-                    <p>Processing speed: {{ speed }} MB/s</p>
-                </div>
-
-                <div class="details">
-                    {% if different_files %}
-                    <div class="section">
-                        <h2>Files with Different Content</h2>
-                        <div class="file-list different">
-                            <ul>
-                            {% for file in different_files %}
-                                <li>{{ file }}</li>
-                            {% endfor %}
-                            </ul>
-                        </div>
-                    </div>
-                    {% endif %}
-
-                    {% if missing_files %}
-                    <div class="section">
-                        <h2>Missing Files (in folder1 but not in folder2)</h2>
-                        <div class="file-list missing">
-                            <ul>
-                            {% for file in missing_files %}
-                                <li>{{ file }}</li>
-                            {% endfor %}
-                            </ul>
-                        </div>
-                    </div>
-                    {% endif %}
-
-                    {% if extra_files %}
-                    <div class="section">
-                        <h2>Extra Files (in folder2 but not in folder1)</h2>
-                        <div class="file-list extra">
-                            <ul>
-                            {% for file in extra_files %}
-                                <li>{{ file }}</li>
-                            {% endfor %}
-                            </ul>
-                        </div>
-                    </div>
-                    {% endif %}
-
-                    {% if error_files %}
-                    <div class="section">
-                        <h2>Error Files</h2>
-                        <div class="file-list error">
-                            <ul>
-                            {% for file, error in error_files %}
-                                <li>{{ file }}: {{ error }}</li>
-                            {% endfor %}
-                            </ul>
-                        </div>
-                    </div>
-                    {% endif %}
-                </div>
-                
-                <div class="footer">
-                    <p>Generated by <strong>{{ repo_name }}</strong> v{{ version }}</p>
-                    <p>Created by <strong>{{ author }}</strong></p>
-                    <div class="project-links">
-                        <a href="{{ github_url }}" target="_blank" class="project-link">
-                            <img src="https://github.com/favicon.ico" alt="GitHub"> GitHub Project
-                        </a>
-                        <a href="{{ pypi_url }}" target="_blank" class="project-link">
-                            <img src="https://pypi.org/static/images/favicon.ico" alt="PyPI"> PyPI Package
-                        </a>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        if mode == "auto":
+            entries = sum(
+                len(results.get(key, []))
+                for key in ("different_files", "missing_files", "extra_files",
+                            "moved_files", "duplicate_files", "error_files")
+            )
+            mode = "inline" if entries <= HTML_INLINE_LIMIT else "scalable"
 
         # Prepare template data
         template_data = {
@@ -710,21 +2698,143 @@ class DirectoryComparer:
             "different_files_count": len(results["different_files"]),
             "missing_files_count": len(results["missing_files"]),
             "extra_files_count": len(results["extra_files"]),
+            "moved_files_count": len(moved_files),
             "error_files_count": len(results["error_files"]),
             "data_processed": f"{results['total_size_processed'] / (1024*1024):.2f}",
             "time_elapsed": f"{results['time_elapsed']:.2f}",
             "speed": f"{speed / (1024*1024):.2f}",
+            "read_time": f"{results.get('read_time', 0):.2f}",
+            "hash_time": f"{results.get('hash_time', 0):.2f}",
+            "phase_times": format_phase_times(results),
             "different_files": sorted(results["different_files"]),
             "missing_files": sorted(results["missing_files"]),
             "extra_files": sorted(results["extra_files"]),
+            "moved_files": sorted(moved_files),
+            "duplicate_files": results.get("duplicate_files", []),
+            "block_diffs": {
+                file: format_block_diff(diff)
+                for file, diff in results.get("block_diffs", {}).items()
+            },
+            "duplicate_wasted": "{:.2f}".format(
+                sum(c["wasted_bytes"] for c in results.get("duplicate_files", [])) / (1024 * 1024)
+            ),
             "error_files": results["error_files"],
             "repo_name": "HPFC - High-Performance Folder Compare",
             "github_url": "https://github.com/ethan-li/hpfc",
             "pypi_url": "https://pypi.org/project/hpfc-tool/",
             "version": __version__,
-            "author": "Ethan Li"
+            "author": "Ethan Li",
+            "report_data": None,
         }
 
-        # Render template
-        template = jinja2.Template(template_str)
-        return template.render(**template_data)
+        if mode != "inline":
+            # File lists are rendered by the browser, only the visible rows become DOM nodes
+            data = json.dumps(self._report_rows(results), separators=(",", ":"))
+            if mode == "compressed":
+                data = base64.b64encode(gzip.compress(data.encode("utf-8"))).decode("ascii")
+            else:
+                # No "</script>" or "<!--" can end the embedding script element early
+                data = data.replace("<", "\\u003c")
+            for key in ("different_files", "missing_files", "extra_files", "moved_files",
+                        "duplicate_files", "error_files"):
+                template_data[key] = []
+            template_data["report_data"] = data
+            template_data["data_encoding"] = "gzip" if mode == "compressed" else "json"
+
+        return _html_template().render(**template_data)
+
+
+def create_tree_manifest(
+    directory: str,
+    manifest_path: str,
+    chunk_size: int = 8 * 1024 * 1024,
+    hash_algorithm: str = DEFAULT_HASH_ALGORITHM,
+    ignore_patterns: List[str] = None,
+    max_workers: Optional[int] = None,
+    scan_workers: Optional[int] = None,
+    show_progress: bool = True,
+    ignore_files: Tuple[str, ...] = DEFAULT_IGNORE_FILES,
+) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Write a tree manifest of a directory, to later compare other trees against it
+
+    The tree is scanned like a comparison folder and every file is digested on a
+    thread pool, records are streamed to the manifest in completion order.
+
+    Args:
+        directory: Directory to describe
+        manifest_path: Path of the manifest file to write
+        chunk_size: Read size used while digesting
+        hash_algorithm: Digest stored in the manifest
+        ignore_patterns: List of file/directory patterns to ignore
+        max_workers: Number of digest threads, None for four per CPU up to 32
+        scan_workers: Number of threads used to scan the tree
+        show_progress: Whether to show progress bar
+        ignore_files: Names of gitignore-style files read from the directory root
+
+    Returns: (number of files written, [(rel_path, error)] of unreadable files)
+    """
+    scanner = DirectoryComparer(
+        directory,
+        directory,
+        chunk_size=chunk_size,
+        ignore_patterns=ignore_patterns,
+        scan_workers=scan_workers,
+        hash_algorithm=hash_algorithm,
+        ignore_files=ignore_files,
+    )
+    print(f"Scanning directory: {scanner.dir1}")
+    (files_dict,) = scanner.scan_trees([scanner.dir1])
+    errors = list(scanner.scan_errors)
+    workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+
+    def digest(rel_path: str) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            path = os.path.join(scanner.dir1, rel_path)
+            return file_digest(path, chunk_size, scanner.hash_algorithm), None
+        except OSError as e:
+            return None, str(e)
+
+    progress = None
+    if show_progress:
+        progress = ProgressBar(
+            len(files_dict), prefix="Digesting:", suffix="Complete", length=50,
+            total_bytes=sum(st.size for st in files_dict.values()),
+        )
+
+    metadata = {
+        "root": scanner.dir1,
+        "hash_algorithm": scanner.hash_algorithm,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    paths = iter(files_dict)
+    done = 0
+    with ManifestWriter(manifest_path, TREE_MANIFEST, metadata) as writer, \
+            ThreadPoolExecutor(max_workers=workers) as executor, \
+            progress or contextlib.nullcontext():
+        # Bounded in-flight digests keep memory flat on huge trees
+        in_flight = {}
+        for rel_path in paths:
+            in_flight[executor.submit(digest, rel_path)] = rel_path
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                rel_path = in_flight.pop(future)
+                file_hash, error = future.result()
+                if error is not None:
+                    errors.append((rel_path, error))
+                else:
+                    st = files_dict[rel_path]
+                    writer.write(ManifestEntry(
+                        rel_path, "", (st.size, st.mtime_ns, st.inode), None, file_hash
+                    ))
+                done += 1
+                if progress:
+                    progress.update(done, files_dict[rel_path].size)
+                next_path = next(paths, None)
+                if next_path is not None:
+                    in_flight[executor.submit(digest, next_path)] = next_path
+
+    return writer.count, errors
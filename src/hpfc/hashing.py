@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Hashing
+
+Pluggable content digest backends.
+SHA256 and BLAKE2b come from hashlib and CRC32 from zlib. xxHash3 and BLAKE3
+need the optional xxhash and blake3 packages (pip install hpfc-tool[fast]),
+when they are missing BLAKE2b is used instead.
+"""
+
+import hashlib
+import warnings
+import zlib
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover - optional dependency
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:  # pragma: no cover - optional dependency
+    blake3 = None
+
+HASH_ALGORITHMS = ("sha256", "blake2b", "xxh3-128", "blake3", "crc32")
+DEFAULT_HASH_ALGORITHM = "sha256"
+FALLBACK_HASH_ALGORITHM = "blake2b"
+
+
+class _CRC32:
+    """hashlib-style wrapper around zlib.crc32"""
+
+    def __init__(self):
+        self._value = 0
+
+    def update(self, data: bytes) -> None:
+        self._value = zlib.crc32(data, self._value)
+
+    def hexdigest(self) -> str:
+        return f"{self._value:08x}"
+
+
+def is_available(algorithm: str) -> bool:
+    """Check whether the backend for a hash algorithm is installed"""
+    if algorithm == "xxh3-128":
+        return xxhash is not None
+    if algorithm == "blake3":
+        return blake3 is not None
+    return algorithm in HASH_ALGORITHMS
+
+
+def resolve_algorithm(algorithm: str) -> str:
+    """
+    Validate a hash algorithm name, falling back if its backend is not installed
+
+    Raises ValueError for unknown algorithms and warns when falling back.
+
+    Returns: The algorithm that will actually be used
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(
+            f"Unknown hash algorithm: {algorithm} (choose from {', '.join(HASH_ALGORITHMS)})"
+        )
+    if not is_available(algorithm):
+        warnings.warn(
+            f"Hash algorithm {algorithm} is not installed, "
+            f"falling back to {FALLBACK_HASH_ALGORITHM}",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+        return FALLBACK_HASH_ALGORITHM
+    return algorithm
+
+
+def new_hasher(algorithm: str):
+    """Create an incremental hasher with update() and hexdigest() for an algorithm"""
+    if algorithm == "sha256":
+        return hashlib.sha256()
+    if algorithm == "blake2b":
+        return hashlib.blake2b()
+    if algorithm == "xxh3-128" and xxhash is not None:
+        return xxhash.xxh3_128()
+    if algorithm == "blake3" and blake3 is not None:
+        return blake3.blake3()
+    if algorithm == "crc32":
+        return _CRC32()
+    raise ValueError(f"Hash algorithm not available: {algorithm}")
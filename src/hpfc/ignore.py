@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Ignore
+
+Compiled ignore rules for scanning.
+All patterns are translated to regular expressions over '/'-separated paths
+relative to the tree root and combined into a few alternations, so matching a
+path costs one regex search instead of one check per pattern.
+
+Pattern syntax:
+
+- plain text such as "cache" matches files and directories whose name contains
+  it (the original --ignore behaviour)
+- globs such as "*.tmp" or "build/**/out" use gitignore rules: "*" and "?"
+  stay within one path component and "**" spans any number of them
+- a pattern containing a "/" (other than a trailing one), or starting with
+  "/", is anchored to the tree root, otherwise it matches at any depth
+- a trailing "/" only matches directories
+- "re:" followed by a regular expression is searched in the relative path
+- "!" re-includes paths matched by earlier patterns, the last matching pattern
+  wins like in .gitignore
+
+Patterns read from ignore files (.hpfcignore, .gitignore) follow gitignore
+rules, so a plain name there matches that exact name instead of a substring.
+"""
+
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+
+DEFAULT_IGNORE_FILES = (".hpfcignore",)
+GITIGNORE_FILE = ".gitignore"
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+def _translate_glob(glob: str) -> str:
+    """Translate a gitignore-style glob to a regex matching a whole path"""
+    parts = []
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif char == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif char == "?":
+            parts.append("[^/]")
+            i += 1
+        elif char == "[":
+            end = glob.find("]", i + 2 if glob.startswith("[!", i) else i + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+                i += 1
+                continue
+            body = glob[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body}]")
+            i = end + 1
+        else:
+            parts.append(re.escape(char))
+            i += 1
+    return "".join(parts)
+
+
+def compile_pattern(pattern: str, gitignore: bool = False) -> Optional[Tuple[bool, bool, str]]:
+    """
+    Translate an ignore pattern
+
+    Args:
+        pattern: Pattern in the syntax described in the module docstring
+        gitignore: Parse with gitignore rules, where plain names match exactly
+
+    Returns: (negated, directories_only, regex) or None for blank and comment lines
+    """
+    if gitignore:
+        pattern = pattern.rstrip()
+        if not pattern or pattern.startswith("#"):
+            return None
+    if not pattern:
+        return None
+
+    negated = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+        pattern = pattern[1:]
+
+    if pattern.startswith("re:"):
+        try:
+            re.compile(pattern[3:])
+        except re.error as e:
+            raise ValueError(f"Invalid ignore regex {pattern[3:]!r}: {e}")
+        return negated, False, pattern[3:]
+
+    directories_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if not gitignore and not anchored and not _GLOB_CHARS.search(pattern):
+        # Plain names keep substring semantics on the last path component
+        return negated, directories_only, f"(?:^|/)[^/]*{re.escape(pattern)}[^/]*$"
+
+    regex = _translate_glob(pattern)
+    prefix = "^" if anchored else "(?:^|/)"
+    return negated, directories_only, f"{prefix}{regex}$"
+
+
+def read_ignore_file(path: str) -> List[str]:
+    """Return the lines of an ignore file, or an empty list if it does not exist"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+class IgnoreMatcher:
+    """Compiled set of ignore patterns"""
+
+    def __init__(self, patterns: Iterable[str] = (), gitignore_patterns: Iterable[str] = ()):
+        """
+        Args:
+            patterns: Patterns in the syntax described in the module docstring
+            gitignore_patterns: Lines of ignore files, parsed with gitignore rules
+        """
+        rules = [compile_pattern(pattern) for pattern in patterns]
+        rules.extend(compile_pattern(line, gitignore=True) for line in gitignore_patterns)
+        rules = [rule for rule in rules if rule is not None]
+
+        # Consecutive rules of the same sign are combined, so the last matching rule
+        # is found by testing the groups from the last one backwards
+        self._groups: List[Tuple[bool, Optional[re.Pattern], Optional[re.Pattern]]] = []
+        start = 0
+        for end in range(1, len(rules) + 1):
+            if end == len(rules) or rules[end][0] != rules[start][0]:
+                group = rules[start:end]
+                file_regexes = [regex for _, dirs_only, regex in group if not dirs_only]
+                dir_regexes = [regex for _, _, regex in group]
+                self._groups.append((
+                    group[0][0],
+                    self._combine(file_regexes),
+                    self._combine(dir_regexes),
+                ))
+                start = end
+        self._groups.reverse()
+
+    @staticmethod
+    def _combine(regexes: List[str]) -> Optional[re.Pattern]:
+        if not regexes:
+            return None
+        return re.compile("|".join(f"(?:{regex})" for regex in regexes))
+
+    @classmethod
+    def for_trees(
+        cls,
+        roots: Iterable[str],
+        patterns: Iterable[str] = (),
+        ignore_files: Iterable[str] = DEFAULT_IGNORE_FILES,
+    ) -> "IgnoreMatcher":
+        """
+        Build a matcher from patterns and the ignore files at the root of each tree
+
+        The rules of all trees are combined, so the same paths are ignored on
+        every side of a comparison.
+        """
+        gitignore_patterns = []
+        for root in roots:
+            for name in ignore_files:
+                gitignore_patterns.extend(read_ignore_file(os.path.join(root, name)))
+        return cls(patterns, gitignore_patterns)
+
+    def __bool__(self) -> bool:
+        return bool(self._groups)
+
+    def match(self, rel_path: str, is_dir: bool = False) -> bool:
+        """Check whether a file or directory path relative to the tree root is ignored"""
+        if not self._groups:
+            return False
+        if os.sep != "/":
+            rel_path = rel_path.replace(os.sep, "/")
+        for negated, file_regex, dir_regex in self._groups:
+            regex = dir_regex if is_dir else file_regex
+            if regex is not None and regex.search(rel_path):
+                return not negated
+        return False
+
+    def match_path(self, rel_path: str) -> bool:
+        """Check whether a file is ignored, either itself or through an ignored parent"""
+        if not self._groups:
+            return False
+        if os.sep != "/":
+            rel_path = rel_path.replace(os.sep, "/")
+        parts = rel_path.split("/")
+        for depth in range(1, len(parts)):
+            if self.match("/".join(parts[:depth]), is_dir=True):
+                return True
+        return self.match(rel_path)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Manifest
+
+Compact binary manifests of comparison runs and directory trees.
+A manifest is a gzip stream starting with a small JSON header, followed by one
+packed record per file holding its relative path, verdict, the
+(size, mtime_ns, inode) stat tuple of each side and any known digests. Tree
+manifests describe a single tree and only fill in the first side.
+Records are written and read one at a time, so manifests of huge trees never
+need to fit in memory.
+"""
+
+import gzip
+import json
+import os
+import struct
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+MAGIC = b"HPFM"
+VERSION = 1
+
+# Manifest kinds
+RUN_MANIFEST = "run"  # Verdicts of a comparison, for incremental re-compares
+TREE_MANIFEST = "tree"  # Stat tuples and digests of a single tree, to compare against
+
+_STATUS_CODES = {"": 0, "identical": 1, "different": 2, "missing": 3, "extra": 4, "moved": 5}
+_STATUS_NAMES = {code: name for name, code in _STATUS_CODES.items()}
+
+# Record flags
+_HAS_STAT1 = 1
+_HAS_STAT2 = 2
+_HAS_DIGEST1 = 4
+_HAS_DIGEST2 = 8
+_HAS_MOVED_FROM = 16
+
+_RECORD_HEADER = struct.Struct("<IBB")  # path length, status code, flags
+_STAT = struct.Struct("<QqQ")  # size, mtime_ns, inode
+_LENGTH = struct.Struct("<I")
+
+
+class ManifestEntry(NamedTuple):
+    """A single file record of a manifest"""
+
+    rel_path: str
+    status: str  # Verdict of the run, "" if the manifest holds no verdicts
+    stat1: Optional[Tuple[int, int, int]] = None  # (size, mtime_ns, inode) in dir1
+    stat2: Optional[Tuple[int, int, int]] = None  # (size, mtime_ns, inode) in dir2
+    digest1: Optional[str] = None
+    digest2: Optional[str] = None
+    moved_from: Optional[str] = None
+
+
+class ManifestError(Exception):
+    """Raised when a file is not a valid manifest"""
+
+
+class ManifestWriter:
+    """
+    Streaming manifest writer
+
+    Records go to a temporary file that replaces the target on close, so an
+    interrupted run never leaves a truncated manifest behind.
+    """
+
+    def __init__(self, path: str, kind: str, metadata: Optional[Dict] = None):
+        """
+        Args:
+            path: Path of the manifest file
+            kind: Manifest kind, such as RUN_MANIFEST
+            metadata: Extra JSON-serializable header fields
+        """
+        self.path = path
+        self.count = 0
+        self._tmp_path = f"{path}.tmp"
+        self._file = gzip.open(self._tmp_path, "wb", compresslevel=6)
+
+        header = json.dumps({"kind": kind, **(metadata or {})}).encode("utf-8")
+        self._file.write(MAGIC + bytes([VERSION]) + _LENGTH.pack(len(header)) + header)
+
+    def write(self, entry: ManifestEntry) -> None:
+        """Append a record"""
+        path = entry.rel_path.encode("utf-8", "surrogateescape")
+        flags = 0
+        parts = [b"", path]
+        for flag, stat in ((_HAS_STAT1, entry.stat1), (_HAS_STAT2, entry.stat2)):
+            if stat is not None:
+                flags |= flag
+                parts.append(_STAT.pack(*stat))
+        for flag, digest in ((_HAS_DIGEST1, entry.digest1), (_HAS_DIGEST2, entry.digest2)):
+            if digest is not None:
+                flags |= flag
+                raw = bytes.fromhex(digest)
+                parts.append(bytes([len(raw)]) + raw)
+        if entry.moved_from is not None:
+            flags |= _HAS_MOVED_FROM
+            moved_from = entry.moved_from.encode("utf-8", "surrogateescape")
+            parts.append(_LENGTH.pack(len(moved_from)) + moved_from)
+
+        parts[0] = _RECORD_HEADER.pack(len(path), _STATUS_CODES[entry.status], flags)
+        self._file.write(b"".join(parts))
+        self.count += 1
+
+    def close(self, commit: bool = True) -> None:
+        """Finish the manifest, or discard it if commit is False"""
+        self._file.close()
+        if commit:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+
+    def __enter__(self) -> "ManifestWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        self.close(commit=exc_type is None)
+
+
+def _read_exact(f, size: int) -> bytes:
+    try:
+        data = f.read(size)
+    except (OSError, EOFError) as e:  # Corrupt or cut-off gzip stream
+        raise ManifestError(f"Truncated manifest ({e})") from e
+    if len(data) != size:
+        raise ManifestError("Truncated manifest")
+    return data
+
+
+def read_manifest(path: str) -> Tuple[Dict, Iterator[ManifestEntry]]:
+    """
+    Open a manifest
+
+    Returns: (header, entries) where entries is an iterator streaming the records
+    """
+    try:
+        f = gzip.open(path, "rb")
+    except OSError as e:
+        raise ManifestError(f"Cannot read manifest: {path} ({e})") from e
+    try:
+        prefix = f.read(len(MAGIC) + 1)
+    except (gzip.BadGzipFile, EOFError) as e:
+        f.close()
+        raise ManifestError(f"Not a manifest: {path} ({e})") from e
+    except OSError as e:
+        f.close()
+        raise ManifestError(f"Cannot read manifest: {path} ({e})") from e
+    if len(prefix) != len(MAGIC) + 1 or prefix[: len(MAGIC)] != MAGIC:
+        f.close()
+        raise ManifestError(f"Not a manifest: {path}")
+    if prefix[len(MAGIC)] != VERSION:
+        f.close()
+        raise ManifestError(f"Unsupported manifest version: {prefix[len(MAGIC)]}")
+    try:
+        (header_length,) = _LENGTH.unpack(_read_exact(f, _LENGTH.size))
+        header = json.loads(_read_exact(f, header_length))
+    except (ManifestError, ValueError) as e:
+        f.close()
+        raise ManifestError(f"Invalid manifest header: {path} ({e})") from e
+
+    def entries() -> Iterator[ManifestEntry]:
+        with f:
+            while True:
+                try:
+                    record_header = f.read(_RECORD_HEADER.size)
+                except (OSError, EOFError) as e:
+                    raise ManifestError(f"Truncated manifest ({e})") from e
+                if not record_header:
+                    return
+                if len(record_header) != _RECORD_HEADER.size:
+                    raise ManifestError("Truncated manifest")
+                path_length, status_code, flags = _RECORD_HEADER.unpack(record_header)
+                rel_path = _read_exact(f, path_length).decode("utf-8", "surrogateescape")
+
+                stats = []
+                for flag in (_HAS_STAT1, _HAS_STAT2):
+                    stats.append(
+                        _STAT.unpack(_read_exact(f, _STAT.size)) if flags & flag else None
+                    )
+                digests = []
+                for flag in (_HAS_DIGEST1, _HAS_DIGEST2):
+                    if flags & flag:
+                        digests.append(_read_exact(f, _read_exact(f, 1)[0]).hex())
+                    else:
+                        digests.append(None)
+                moved_from = None
+                if flags & _HAS_MOVED_FROM:
+                    (length,) = _LENGTH.unpack(_read_exact(f, _LENGTH.size))
+                    moved_from = _read_exact(f, length).decode("utf-8", "surrogateescape")
+
+                yield ManifestEntry(
+                    rel_path, _STATUS_NAMES[status_code], stats[0], stats[1],
+                    digests[0], digests[1], moved_from,
+                )
+
+    return header, entries()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Metrics
+
+Live metrics of long comparisons, for cron jobs and services where a progress
+bar is of no use. MetricsExporter takes snapshots of a running comparer from a
+background thread, so the comparison itself only updates its usual counters.
+Snapshots are served in the Prometheus text exposition format on a local HTTP
+/metrics endpoint, and/or appended as JSON lines to a stats file at a fixed
+interval, with a last line once the comparison is done.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from .core import RESULT_STATUSES, DirectoryComparer
+
+# Statuses counted as differences in snapshots
+DIFFERENCE_STATUSES = ("different", "missing", "extra", "moved")
+
+
+def _copy(mapping: Dict) -> Dict:
+    """Copy a dict that the comparison thread may be adding keys to"""
+    while True:
+        try:
+            return dict(mapping)
+        except RuntimeError:  # Changed size during iteration
+            continue
+
+
+def snapshot(comparer: DirectoryComparer) -> Dict:
+    """
+    Take a snapshot of the counters of a comparer, running or finished
+
+    Returns: JSON-serializable dict with the time, elapsed seconds, whether the
+             comparison is running, its current phase, file counts per status,
+             bytes read, overall and per-lane throughput
+    """
+    now = time.time()
+    started, ended = comparer.start_time, comparer.end_time
+    elapsed = ((ended or now) - started) if started else 0.0
+    counts = _copy(comparer.status_counts)
+    bytes_read = comparer.total_size_processed
+
+    lanes = {}
+    for lane in list(comparer.lanes):
+        files_per_second, bytes_per_second = lane.throughput()
+        lanes[lane.name] = {
+            "files": lane.files_done,
+            "bytes_read": lane.bytes_read,
+            "in_flight": lane.in_flight,
+            "limit": lane.limit,
+            "files_per_second": files_per_second,
+            "bytes_per_second": bytes_per_second,
+        }
+
+    return {
+        "time": now,
+        "elapsed": elapsed,
+        "running": bool(started) and not ended,
+        "phase": comparer.phases.phase,
+        "files_total": comparer.total_files_processed,
+        "files_done": sum(counts.values()),
+        "counts": counts,
+        "differences": sum(counts.get(status, 0) for status in DIFFERENCE_STATUSES),
+        "errors": counts.get("error", 0),
+        "bytes_read": bytes_read,
+        "bytes_per_second": bytes_read / elapsed if elapsed > 0 else 0.0,
+        "read_time": comparer.read_time,
+        "hash_time": comparer.hash_time,
+        "phase_times": _copy(comparer.phases.times),
+        "lanes": lanes,
+    }
+
+
+def render_prometheus(stats: Dict) -> str:
+    """Render a snapshot in the Prometheus text exposition format"""
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str, samples) -> None:
+        lines.append(f"# HELP hpfc_{name} {help_text}")
+        lines.append(f"# TYPE hpfc_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+            if labels:
+                lines.append(f"hpfc_{name}{{{label_text}}} {value}")
+            else:
+                lines.append(f"hpfc_{name} {value}")
+
+    metric("running", "gauge", "Whether a comparison is running", [({}, int(stats["running"]))])
+    metric("elapsed_seconds", "gauge", "Seconds since the comparison started",
+           [({}, stats["elapsed"])])
+    metric("files_planned", "gauge", "Files found in either folder",
+           [({}, stats["files_total"])])
+    metric("files_total", "counter", "Files compared, by status",
+           [({"status": status}, stats["counts"].get(status, 0)) for status in RESULT_STATUSES])
+    metric("differences_total", "counter", "Files that differ, are missing, extra or moved",
+           [({}, stats["differences"])])
+    metric("errors_total", "counter", "Files that could not be compared",
+           [({}, stats["errors"])])
+    metric("bytes_read_total", "counter", "Bytes read from both folders",
+           [({}, stats["bytes_read"])])
+    metric("read_seconds_total", "counter", "Seconds spent reading, summed over workers",
+           [({}, stats["read_time"])])
+    metric("hash_seconds_total", "counter", "Seconds spent hashing, summed over workers",
+           [({}, stats["hash_time"])])
+    metric("phase_seconds_total", "counter", "Seconds spent in each comparison phase",
+           [({"phase": phase}, seconds) for phase, seconds in stats["phase_times"].items()])
+
+    lanes = stats["lanes"]
+    metric("lane_files_total", "counter", "Files compared by each worker lane",
+           [({"lane": name}, lane["files"]) for name, lane in lanes.items()])
+    metric("lane_bytes_read_total", "counter", "Bytes read by each worker lane",
+           [({"lane": name}, lane["bytes_read"]) for name, lane in lanes.items()])
+    metric("lane_in_flight", "gauge", "Batches in flight in each worker lane",
+           [({"lane": name}, lane["in_flight"]) for name, lane in lanes.items()])
+    metric("lane_files_per_second", "gauge", "Recent files/s of each worker lane",
+           [({"lane": name}, lane["files_per_second"]) for name, lane in lanes.items()])
+    metric("lane_bytes_per_second", "gauge", "Recent bytes read/s of each worker lane",
+           [({"lane": name}, lane["bytes_per_second"]) for name, lane in lanes.items()])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Serve and/or log snapshots of a comparer while it runs, as a context manager"""
+
+    def __init__(
+        self,
+        comparer: DirectoryComparer,
+        port: Optional[int] = None,
+        host: str = "127.0.0.1",
+        stats_path: Optional[str] = None,
+        interval: float = 10.0,
+    ):
+        """
+        Args:
+            comparer: Comparer to export the counters of
+            port: Port of the HTTP /metrics endpoint, 0 for any free port, None to disable
+            host: Address the endpoint listens on, local only by default
+            stats_path: File snapshots are appended to as JSON lines, None to disable
+            interval: Seconds between two lines of the stats file
+        """
+        self.comparer = comparer
+        self.port = port
+        self.host = host
+        self.stats_path = stats_path
+        self.interval = interval
+        self._server = None
+        self._threads = []
+        self._stop = threading.Event()
+
+    def __enter__(self) -> "MetricsExporter":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """Start the endpoint and the stats file thread"""
+        if self.port is not None:
+            self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+            self._server.daemon_threads = True
+            # The bound port, when any free port was asked for
+            self.port = self._server.server_address[1]
+            self._spawn(self._server.serve_forever)
+        if self.stats_path:
+            self._spawn(self._log_stats)
+
+    def close(self) -> None:
+        """Write the last stats line and stop the endpoint"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _spawn(self, target) -> None:
+        thread = threading.Thread(target=target, name="hpfc-metrics", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _log_stats(self) -> None:
+        with open(self.stats_path, "a", encoding="utf-8") as f:
+            while True:
+                stopping = self._stop.wait(self.interval)
+                f.write(json.dumps(snapshot(self.comparer)) + "\n")
+                f.flush()
+                if stopping:
+                    return
+
+    def _handler(self):
+        comparer = self.comparer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_prometheus(snapshot(comparer)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                # Scrapes would otherwise be logged to stderr
+                pass
+
+        return Handler
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Profiling
+
+Per-phase timing and tracing of comparisons.
+PhaseTimer attributes the wall-clock time of the parent process to one phase
+at a time, so the phase times of a run add up to its elapsed time and show
+whether scanning, waiting on workers, dispatching batches or writing reports
+dominates. With tracing enabled it also records spans of the phases and of
+every batch run by a worker, which write_chrome_trace saves in the Chrome
+trace event format (chrome://tracing, Perfetto).
+
+Phases:
+
+- manifest: loading the --since run manifest
+- scan: scanning the trees, or loading the reference tree manifest
+- set_diff: splitting paths into common, missing and extra files
+- moves: pairing missing and extra files as moves
+- plan: deciding common files without reading them (sizes, cache, since, quick)
+- pool: starting and stopping the worker pools
+- dispatch: batching and submitting files to the workers
+- wait: blocked until a worker finishes a batch
+- collect: handling finished batches and recording results, the default phase
+- duplicates: finding duplicate content
+- report: consuming results, writing and rendering reports
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+class PhaseTimer:
+    """Exclusive wall-clock time per phase, with optional trace spans"""
+
+    def __init__(self, trace: bool = False):
+        """
+        Args:
+            trace: Record spans for write_chrome_trace
+        """
+        self.times: Dict[str, float] = {}
+        self.events: Optional[List[Dict]] = [] if trace else None
+        self.phase: Optional[str] = None
+        self._since = time.perf_counter()
+
+    def enter(self, phase: Optional[str]) -> Optional[str]:
+        """
+        Charge the time from now on to a phase
+
+        Args:
+            phase: Phase name, None to stop timing
+
+        Returns: The previous phase, to switch back to
+        """
+        now = time.perf_counter()
+        previous = self.phase
+        if previous is not None:
+            self.times[previous] = self.times.get(previous, 0.0) + now - self._since
+        self.phase = phase
+        self._since = now
+        return previous
+
+    @contextlib.contextmanager
+    def span(self, phase: str, **args) -> Iterator[None]:
+        """Charge a block to a phase and trace it as a span, then switch back"""
+        previous = self.enter(phase)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.enter(previous)
+            self.add_span(phase, start, time.time(), **args)
+
+    def add_span(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        pid: Optional[int] = None,
+        tid: Optional[int] = None,
+        category: str = "phase",
+        **args,
+    ) -> None:
+        """
+        Record a span when tracing
+
+        Args:
+            name: Span name
+            start, end: Wall-clock times from time.time(), comparable across processes
+            pid, tid: Process and thread that ran the span, None for the calling thread
+            category: Trace category, "phase" or "worker"
+            args: Extra values shown with the span
+        """
+        if self.events is None:
+            return
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid() if pid is None else pid,
+            "tid": threading.get_ident() if tid is None else tid,
+            "args": args,
+        })
+
+
+def write_chrome_trace(path: str, events: List[Dict]) -> None:
+    """Write trace spans as a Chrome trace event JSON file"""
+    parent = os.getpid()
+    names = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": pid,
+            "tid": 0,
+            "args": {"name": "hpfc" if pid == parent else f"hpfc worker {pid}"},
+        }
+        for pid in sorted({event["pid"] for event in events})
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": names + events, "displayTimeUnit": "ms"}, f)
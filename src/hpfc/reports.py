@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HPFC Reports
+
+Streaming machine-readable report writers.
+Unlike the text and HTML reports, these write one record per file as soon as
+its result is known and only keep per-status counts, so memory stays flat on
+huge trees. A summary record is appended at the end:
+
+- ndjson: one JSON object per line, {"type": "file", ...} records followed by
+  a {"type": "summary", ...} record
+- json: a single object {"files": [...], "summary": {...}}
+- csv: a header row, one "file" row per result, then "summary" rows holding
+  one key (in the path column) and value (in the status column) each
+
+diff_blocks are runs of (first_block, block_count), in blocks of the summary's
+block_size bytes.
+"""
+
+import csv
+import json
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, TextIO
+
+from .core import RESULT_STATUSES, DirectoryComparer, FileResult
+
+REPORT_FORMATS = ("ndjson", "json", "csv")
+
+CSV_COLUMNS = (
+    "type", "path", "status", "moved_from", "error",
+    "digest1", "digest2", "diff_bytes", "diff_blocks",
+)
+
+
+def result_record(result: FileResult) -> Dict:
+    """Return the report record of a result, without the fields that are not set"""
+    record = {"path": result.rel_path, "status": result.status}
+    for field in ("moved_from", "error", "digest1", "digest2", "diff_bytes", "diff_blocks"):
+        value = getattr(result, field)
+        if value is not None:
+            record[field] = value
+    return record
+
+
+def summary_record(comparer: DirectoryComparer, counts: Dict[str, int]) -> Dict:
+    """Return the summary record of a finished comparison"""
+    return {
+        "dir1": comparer.dir1,
+        "dir2": comparer.dir2,
+        "counts": {
+            status: counts.get(status, 0)
+            for status in RESULT_STATUSES
+        },
+        "total_files_processed": comparer.total_files_processed,
+        "total_size_processed": comparer.total_size_processed,
+        "read_time": comparer.read_time,
+        "hash_time": comparer.hash_time,
+        "time_elapsed": comparer.end_time - comparer.start_time if comparer.end_time else 0,
+        "phase_times": dict(comparer.phases.times),
+        "scan_times": dict(comparer.scan_times),
+        "worker_times": dict(comparer.worker_times),
+        "duplicate_files": comparer.duplicate_files,
+        # Size of the blocks counted by diff_blocks runs, None without difference maps
+        "block_size": comparer.diff_block_size,
+    }
+
+
+class ReportWriter(ABC):
+    """Base class of the streaming report writers"""
+
+    def __init__(self, stream: TextIO):
+        """
+        Args:
+            stream: Text stream the report is written to
+        """
+        self.stream = stream
+        self.counts = Counter()
+
+    def write(self, result: FileResult) -> None:
+        """Write the record of a result"""
+        self.counts[result.status] += 1
+        self._write_record(result_record(result))
+
+    def close(self, comparer: DirectoryComparer) -> None:
+        """Write the summary record of the finished comparison"""
+        self._write_summary(summary_record(comparer, self.counts))
+        self.stream.flush()
+
+    @abstractmethod
+    def _write_record(self, record: Dict) -> None:
+        """Write a file record"""
+
+    @abstractmethod
+    def _write_summary(self, summary: Dict) -> None:
+        """Write the summary record"""
+
+
+class NdjsonReportWriter(ReportWriter):
+    """One JSON object per line"""
+
+    def _write_record(self, record: Dict) -> None:
+        self.stream.write(json.dumps({"type": "file", **record}) + "\n")
+
+    def _write_summary(self, summary: Dict) -> None:
+        self.stream.write(json.dumps({"type": "summary", **summary}) + "\n")
+
+
+class JsonReportWriter(ReportWriter):
+    """A single JSON document, with the files array written incrementally"""
+
+    def __init__(self, stream: TextIO):
+        super().__init__(stream)
+        self._first = True
+        self.stream.write('{"files": [')
+
+    def _write_record(self, record: Dict) -> None:
+        self.stream.write(("\n" if self._first else ",\n") + json.dumps(record))
+        self._first = False
+
+    def _write_summary(self, summary: Dict) -> None:
+        self.stream.write('\n], "summary": ' + json.dumps(summary) + "}\n")
+
+
+class CsvReportWriter(ReportWriter):
+    """CSV rows, with the summary as trailing key/value rows"""
+
+    def __init__(self, stream: TextIO):
+        super().__init__(stream)
+        self._writer = csv.writer(stream)
+        self._writer.writerow(CSV_COLUMNS)
+
+    def _write_record(self, record: Dict) -> None:
+        if "diff_blocks" in record:
+            record["diff_blocks"] = ";".join(
+                str(first) if count == 1 else f"{first}-{first + count - 1}"
+                for first, count in record["diff_blocks"]
+            )
+        self._writer.writerow(["file"] + [record.get(column, "") for column in CSV_COLUMNS[1:]])
+
+    def _write_summary(self, summary: Dict) -> None:
+        clusters = summary.pop("duplicate_files")
+        counts = summary.pop("counts")
+        summary.update({f"{status}_files": count for status, count in counts.items()})
+        for phase, seconds in summary.pop("phase_times").items():
+            summary[f"{phase}_phase_time"] = seconds
+        for directory, seconds in summary.pop("scan_times").items():
+            summary[f"scan_time {directory}"] = seconds
+        for kind, seconds in summary.pop("worker_times").items():
+            summary[f"worker_{kind}_time"] = seconds
+        summary["duplicate_clusters"] = len(clusters)
+        summary["duplicate_wasted_bytes"] = sum(c["wasted_bytes"] for c in clusters)
+        for key, value in summary.items():
+            self._writer.writerow(["summary", key, value])
+
+
+_WRITERS = {
+    "ndjson": NdjsonReportWriter,
+    "json": JsonReportWriter,
+    "csv": CsvReportWriter,
+}
+
+
+def create_report_writer(report_format: str, stream: TextIO) -> ReportWriter:
+    """Create the streaming writer of a report format, one of REPORT_FORMATS"""
+    if report_format not in _WRITERS:
+        raise ValueError(f"Unknown report format: {report_format}")
+    return _WRITERS[report_format](stream)
+
+
+def write_streaming_report(
+    comparer: DirectoryComparer,
+    report_format: str,
+    stream: TextIO,
+) -> Dict[str, int]:
+    """
+    Run a comparison and stream its report
+
+    Args:
+        comparer: Comparer to run
+        report_format: One of REPORT_FORMATS
+        stream: Text stream the report is written to
+
+    Returns: Number of results per status
+    """
+    writer = create_report_writer(report_format, stream)
+    for result in comparer.iter_compare():
+        writer.write(result)
+    writer.close(comparer)
+    return dict(writer.counts)
@@ -12,19 +12,38 @@ Tests for various comparison scenarios including:
 - Large file comparison
 """
 
+import contextlib
+import csv
+import io
+import json
 import os
 import random
 import shutil
 import sys
 import tempfile
 import unittest
+from unittest import mock
+import urllib.request
 
 # Add parent directory to path so we can import the package
 # This is common in test files and an acceptable exception to PEP 8 E402
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # pylint: disable=wrong-import-position
-from src.hpfc.core import DirectoryComparer  # noqa: E402
+from src.hpfc.bench import generate_tree_pair, run_benchmark  # noqa: E402
+from src.hpfc.cache import HashCache  # noqa: E402
+from src.hpfc.cli import main  # noqa: E402
+from src.hpfc.core import (  # noqa: E402
+    DirectoryComparer,
+    ProgressBar,
+    compare_file_contents,
+    create_tree_manifest,
+    file_digest,
+)
+from src.hpfc.hashing import HASH_ALGORITHMS, is_available  # noqa: E402
+from src.hpfc.manifest import read_manifest  # noqa: E402
+from src.hpfc.metrics import MetricsExporter  # noqa: E402
+from src.hpfc.reports import ReportWriter, write_streaming_report  # noqa: E402
 
 
 class TestDirectoryComparer(unittest.TestCase):
@@ -109,6 +128,27 @@ class TestDirectoryComparer(unittest.TestCase):
         self.assertIn("only_in_dir1.txt", results["missing_files"])
         self.assertIn("only_in_dir2.txt", results["extra_files"])
 
+    def test_worker_read_accounting(self):
+        """Test that bytes read and read/hash times are aggregated from the workers"""
+        # Common files: same_file.txt, different_file.txt, sub_same.txt, sub_diff.txt
+        common_bytes = 2 * (13 + 9 + 14 + 11)
+
+        results = DirectoryComparer(self.test_dir1, self.test_dir2).compare()
+        self.assertEqual(results["total_size_processed"], common_bytes)
+        self.assertGreater(results["read_time"], 0)
+        self.assertIn("Processing speed", DirectoryComparer(
+            self.test_dir1, self.test_dir2).generate_text_report(results))
+
+        cache_dir = tempfile.mkdtemp(prefix="cache_")
+        try:
+            results = DirectoryComparer(
+                self.test_dir1, self.test_dir2, cache_path=os.path.join(cache_dir, "hpfc.db")
+            ).compare()
+            self.assertEqual(results["total_size_processed"], common_bytes)
+            self.assertGreater(results["hash_time"], 0)
+        finally:
+            shutil.rmtree(cache_dir)
+
     def test_empty_directories(self):
         """Test comparison of empty directories"""
         # Create two empty directories
@@ -159,6 +199,79 @@ class TestDirectoryComparer(unittest.TestCase):
             shutil.rmtree(temp_dir, ignore_errors=True)
             shutil.rmtree(clone_dir, ignore_errors=True)
 
+    def test_ignore_rules(self):
+        """Test glob, regex, anchored and directory rules, and .hpfcignore files"""
+        for base in (self.test_dir1, self.test_dir2):
+            os.makedirs(os.path.join(base, "node_modules", "pkg"))
+            os.makedirs(os.path.join(base, "build"))
+            self.create_file(os.path.join(base, "node_modules", "pkg", "index.js"), "x")
+            self.create_file(os.path.join(base, "build", "out.o"), "x")
+            self.create_file(os.path.join(base, "subdir", "build"), "a file, not a directory")
+            self.create_file(os.path.join(base, "trace.log"), "x")
+            self.create_file(os.path.join(base, "keep.log"), "x")
+        self.create_file(
+            os.path.join(self.test_dir1, ".hpfcignore"), "# comment\n*.log\n!keep.log\n"
+        )
+
+        comparer = DirectoryComparer(
+            self.test_dir1,
+            self.test_dir2,
+            ignore_patterns=["node_modules/", "/build", r"re:^only_in_dir\d\.txt$"],
+        )
+        files = comparer.get_files_dict(comparer.dir2)
+        self.assertEqual(
+            sorted(files),
+            sorted([
+                "same_file.txt",
+                "different_file.txt",
+                "keep.log",
+                os.path.join("subdir", "sub_same.txt"),
+                os.path.join("subdir", "sub_diff.txt"),
+                os.path.join("subdir", "build"),
+            ]),
+        )
+        self.assertTrue(comparer.should_ignore("node_modules", is_dir=True))
+        self.assertFalse(comparer.should_ignore("node_modules"))
+
+    def test_scan_records(self):
+        """Test that scanning captures a stat record per file"""
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2)
+        files_dict = comparer.get_files_dict(comparer.dir1)
+
+        self.assertEqual(
+            sorted(files_dict),
+            sorted([
+                "same_file.txt",
+                "different_file.txt",
+                "only_in_dir1.txt",
+                os.path.join("subdir", "sub_same.txt"),
+                os.path.join("subdir", "sub_diff.txt"),
+            ]),
+        )
+        record = files_dict["same_file.txt"]
+        st = os.stat(os.path.join(self.test_dir1, "same_file.txt"))
+        self.assertEqual(record.size, len("Hello, World!"))
+        self.assertEqual(record.mtime_ns, st.st_mtime_ns)
+        self.assertEqual(record.inode, st.st_ino)
+        self.assertEqual(record.dev, st.st_dev)
+
+    def test_parallel_scan(self):
+        """Test that concurrent scanning finds files in nested subtrees of both folders"""
+        for base in (self.test_dir1, self.test_dir2):
+            for i in range(5):
+                nested = os.path.join(base, f"tree{i}", "a", "b")
+                os.makedirs(nested)
+                self.create_file(os.path.join(nested, "leaf.txt"), f"leaf {i}")
+
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, scan_workers=4)
+        files_dict1, files_dict2 = comparer.scan_trees([comparer.dir1, comparer.dir2])
+        self.assertEqual(len(files_dict1), 10)
+        self.assertEqual(len(files_dict2), 10)
+        self.assertIn(os.path.join("tree3", "a", "b", "leaf.txt"), files_dict2)
+
+        results = comparer.compare()
+        self.assertEqual(len(results["identical_files"]), 7)
+
     def test_ignore_patterns(self):
         """Test pattern ignoring functionality"""
         comparer = DirectoryComparer(
@@ -198,6 +311,595 @@ class TestDirectoryComparer(unittest.TestCase):
         self.assertIn("large_file_same.bin", results["identical_files"])
         self.assertIn("large_file_diff.bin", results["different_files"])
 
+    def test_streaming_comparison_across_chunks(self):
+        """Test that chunked streaming comparison finds late differences"""
+        file1 = os.path.join(self.test_dir1, "chunked.bin")
+        file2 = os.path.join(self.test_dir2, "chunked.bin")
+        data = bytes(range(256)) * 64  # 16KB
+        with open(file1, "wb") as f:
+            f.write(data)
+        with open(file2, "wb") as f:
+            f.write(data[:-1] + b"\x00")
+
+        self.assertTrue(compare_file_contents(file1, file1, 1024))
+        self.assertFalse(compare_file_contents(file1, file2, 1024))
+
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, chunk_size=1024)
+        results = comparer.compare()
+        self.assertIn("chunked.bin", results["different_files"])
+
+    def test_batched_comparison(self):
+        """Test that batch limits do not change the comparison results"""
+        for max_files, max_bytes in [(1, 64 * 1024 * 1024), (256, 1), (3, 20)]:
+            comparer = DirectoryComparer(
+                self.test_dir1,
+                self.test_dir2,
+                batch_max_files=max_files,
+                batch_max_bytes=max_bytes,
+            )
+            results = comparer.compare()
+            self.assertEqual(
+                sorted(results["identical_files"]),
+                sorted(["same_file.txt", os.path.join("subdir", "sub_same.txt")]),
+            )
+            self.assertEqual(len(results["different_files"]), 2)
+            self.assertEqual(len(results["error_files"]), 0)
+
+    def test_small_and_large_lanes(self):
+        """Test that splitting files between the thread and process lanes keeps results"""
+        # "Hello, World!" (13 bytes) and "Different A/B" (11 bytes) go to the large lane
+        comparer = DirectoryComparer(
+            self.test_dir1, self.test_dir2, large_file_threshold=11, small_lane_workers=2,
+            large_lane_workers=2,
+        )
+        results = comparer.compare()
+        self.assertEqual(
+            sorted(results["identical_files"]),
+            sorted(["same_file.txt", os.path.join("subdir", "sub_same.txt")]),
+        )
+        self.assertEqual(
+            sorted(results["different_files"]),
+            sorted(["different_file.txt", os.path.join("subdir", "sub_diff.txt")]),
+        )
+        lanes = {lane.name: lane for lane in comparer.lanes}
+        self.assertEqual(lanes["small"].max_limit, 4)
+        # The large lane keeps at most one batch per process in flight
+        self.assertEqual(lanes["large"].max_limit, 2)
+
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, large_file_threshold=11)
+        comparer.compare()
+        lanes = {lane.name: lane for lane in comparer.lanes}
+        self.assertEqual(lanes["large"].max_limit, min(4, os.cpu_count() or 1))
+
+    def test_per_device_workers(self):
+        """Test that limiting concurrent readers per device keeps results"""
+        dev = os.stat(self.test_dir1).st_dev
+        comparer = DirectoryComparer(
+            self.test_dir1,
+            self.test_dir2,
+            batch_max_files=1,
+            per_device_workers=2,
+            device_workers={dev: 1},
+            detect_rotational=True,
+        )
+        self.assertEqual(comparer._device_limit(dev), 1)
+        results = comparer.compare()
+        self.assertEqual(len(results["identical_files"]), 2)
+        self.assertEqual(len(results["different_files"]), 2)
+
+        with self.assertRaises(ValueError):
+            DirectoryComparer(self.test_dir1, self.test_dir2, per_device_workers=0)
+
+    def test_iter_compare_and_callback(self):
+        """Test streaming results through iter_compare and the compare callback"""
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, show_progress=False)
+        streamed = {result.rel_path: result.status for result in comparer.iter_compare()}
+        self.assertEqual(streamed["same_file.txt"], "identical")
+        self.assertEqual(streamed["different_file.txt"], "different")
+        self.assertEqual(streamed["only_in_dir1.txt"], "missing")
+        self.assertEqual(streamed["only_in_dir2.txt"], "extra")
+        self.assertEqual(len(streamed), 6)
+
+        seen = []
+        results = comparer.compare(on_result=seen.append)
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(results["identical_files"]), 2)
+        self.assertEqual(len(results["missing_files"]), 1)
+
+    def test_quick_mode(self):
+        """Test that quick mode trusts size and mtime unless sampled for verification"""
+        # Same size and mtime but different content
+        for base, content in ((self.test_dir1, "AAAA"), (self.test_dir2, "BBBB")):
+            path = os.path.join(base, "stale.txt")
+            self.create_file(path, content)
+            os.utime(path, ns=(0, 1_000_000_000))
+
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, quick=True)
+        results = comparer.compare()
+        self.assertIn("stale.txt", results["identical_files"])
+
+        comparer = DirectoryComparer(
+            self.test_dir1, self.test_dir2, quick=True, verify_sample=100
+        )
+        results = comparer.compare()
+        self.assertIn("stale.txt", results["different_files"])
+
+    def test_cli_verify_sample_requires_quick(self):
+        """Test that the CLI rejects --verify-sample without --quick"""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            code = main([self.test_dir1, self.test_dir2, "--verify-sample", "5%"])
+        self.assertEqual(code, 1)
+        self.assertIn("Error: --verify-sample requires --quick", output.getvalue())
+
+    def test_hash_algorithms(self):
+        """Test every hash backend, falling back when an optional one is missing"""
+        path = os.path.join(self.test_dir1, "same_file.txt")
+        for algorithm in HASH_ALGORITHMS:
+            if is_available(algorithm):
+                comparer = DirectoryComparer(
+                    self.test_dir1, self.test_dir2, hash_algorithm=algorithm
+                )
+            else:
+                with self.assertWarns(RuntimeWarning):
+                    comparer = DirectoryComparer(
+                        self.test_dir1, self.test_dir2, hash_algorithm=algorithm
+                    )
+                self.assertEqual(comparer.hash_algorithm, "blake2b")
+
+            digest = comparer.calculate_file_hash(path)
+            self.assertEqual(digest, file_digest(path, 4, comparer.hash_algorithm))
+
+        self.assertEqual(
+            file_digest(path, 1024, "sha256"),
+            "dffd6021bb2bd5b0af676290809ec3a53191dd81c7f70a4b28688a362182986f",
+        )
+        with self.assertRaises(ValueError):
+            DirectoryComparer(self.test_dir1, self.test_dir2, hash_algorithm="md4")
+
+    def test_prefilter_finds_tail_difference(self):
+        """Test that sampled blocks catch a difference near the end of a large file"""
+        file1 = os.path.join(self.test_dir1, "tail.bin")
+        file2 = os.path.join(self.test_dir2, "tail.bin")
+        data = bytes(range(256)) * 8192  # 2MB
+        with open(file1, "wb") as f:
+            f.write(data)
+        with open(file2, "wb") as f:
+            f.write(data[:-10] + b"0123456789")
+
+        for prefilter in (True, False):
+            self.assertFalse(compare_file_contents(file1, file2, 64 * 1024, prefilter=prefilter))
+            self.assertTrue(compare_file_contents(file1, file1, 64 * 1024, prefilter=prefilter))
+
+    def test_mmap_engine(self):
+        """Test the memory-mapped engine on empty, small, unaligned and multi-chunk files"""
+        for name, data in (
+            ("empty.bin", b""),
+            ("small.bin", b"abc"),
+            ("unaligned.bin", bytes(range(256)) * 1000 + b"xyz"),
+        ):
+            file1 = os.path.join(self.test_dir1, name)
+            file2 = os.path.join(self.test_dir2, name)
+            with open(file1, "wb") as f:
+                f.write(data)
+            with open(file2, "wb") as f:
+                f.write(data[:-1] + b"!" if data else b"")
+
+            self.assertTrue(compare_file_contents(file1, file1, 4096, engine="mmap"))
+            self.assertEqual(compare_file_contents(file1, file2, 4096, engine="mmap"), not data)
+            self.assertEqual(compare_file_contents(file1, file2, 4096), not data)
+
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, engine="mmap")
+        results = comparer.compare()
+        self.assertIn("same_file.txt", results["identical_files"])
+        self.assertIn("unaligned.bin", results["different_files"])
+        self.assertIn("empty.bin", results["identical_files"])
+
+    def test_detect_moves(self):
+        """Test that renamed files are reported as moves instead of missing and extra"""
+        os.makedirs(os.path.join(self.test_dir2, "archive"))
+        self.create_file(os.path.join(self.test_dir1, "report.txt"), "Quarterly numbers")
+        self.create_file(
+            os.path.join(self.test_dir2, "archive", "report.txt"), "Quarterly numbers"
+        )
+        self.create_file(os.path.join(self.test_dir1, "old_name.txt"), "Renamed content!")
+        self.create_file(os.path.join(self.test_dir2, "new_name.txt"), "Renamed content!")
+
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, detect_moves=True)
+        results = comparer.compare()
+        self.assertEqual(
+            sorted(results["moved_files"]),
+            [
+                ("old_name.txt", "new_name.txt"),
+                ("report.txt", os.path.join("archive", "report.txt")),
+            ],
+        )
+        self.assertEqual(results["missing_files"], ["only_in_dir1.txt"])
+        self.assertEqual(results["extra_files"], ["only_in_dir2.txt"])
+
+        report = comparer.generate_text_report(results)
+        self.assertIn("Moved files: 2", report)
+        self.assertIn("old_name.txt -> new_name.txt", report)
+        html = comparer.generate_html_report(results)
+        self.assertIn("old_name.txt &rarr; new_name.txt", html)
+        self.assertRegex(html, r'class="stat-value warning">\s*2\s*<')
+
+        # A candidate that cannot be read stays extra, once, with the read error
+        self.create_file(os.path.join(self.test_dir2, "locked.txt"), "Renamed content!")
+
+        def failing_digest(path, *args, **kwargs):
+            if path.endswith("locked.txt"):
+                raise OSError("Permission denied")
+            return file_digest(path, *args, **kwargs)
+
+        reported = {}
+        with mock.patch("src.hpfc.core.file_digest", failing_digest):
+            for result in comparer.iter_compare():
+                self.assertNotIn(result.rel_path, reported)
+                reported[result.rel_path] = result
+        self.assertEqual(reported["locked.txt"].status, "extra")
+        self.assertEqual(reported["locked.txt"].error, "Permission denied")
+        self.assertEqual(comparer.status_counts["extra"], 2)
+        self.assertEqual(comparer.status_counts["error"], 0)
+
+    def test_find_duplicates(self):
+        """Test that duplicate clusters within a tree are reported with wasted bytes"""
+        block = bytes(range(256)) * 512  # 128KB, larger than the partial hash block
+        for name, data in (
+            ("copy1.bin", block),
+            ("copy2.bin", block),
+            ("copy3.bin", block),
+            ("near_copy.bin", block[:-1] + b"\x00"),
+        ):
+            with open(os.path.join(self.test_dir1, name), "wb") as f:
+                f.write(data)
+        with open(os.path.join(self.test_dir2, "copy1.bin"), "wb") as f:
+            f.write(block)
+
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, find_duplicates=True)
+        compared = {}
+        with mock.patch("src.hpfc.core.file_digest", wraps=file_digest) as digest:
+            results = comparer.compare(
+                on_result=lambda result: compared.setdefault(result.rel_path, result)
+            )
+        self.assertEqual(compared["copy1.bin"].digest1, file_digest(
+            os.path.join(self.test_dir1, "copy1.bin"), 65536, comparer.hash_algorithm
+        ))
+        # copy1.bin is fully digested once per side, by the comparison, and the
+        # duplicate index reuses those digests instead of reading it again
+        hashed = [
+            call.args[0] for call in digest.call_args_list
+            if len(call.args) < 4 and call.kwargs.get("limit") is None
+        ]
+        for directory in (self.test_dir1, self.test_dir2):
+            self.assertEqual(hashed.count(os.path.join(directory, "copy1.bin")), 1)
+        clusters = results["duplicate_files"]
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]["files1"], ["copy1.bin", "copy2.bin", "copy3.bin"])
+        self.assertEqual(clusters[0]["files2"], ["copy1.bin"])
+        self.assertEqual(clusters[0]["wasted_bytes"], 2 * len(block))
+        self.assertIn("Duplicate content clusters: 1", comparer.generate_text_report(results))
+
+    def test_since_manifest(self):
+        """Test that unchanged files keep the verdict of a previous run manifest"""
+        manifest_path = os.path.join(tempfile.mkdtemp(prefix="manifest_"), "run.hpfm")
+        try:
+            comparer = DirectoryComparer(
+                self.test_dir1, self.test_dir2, save_manifest=manifest_path
+            )
+            first = comparer.compare()
+            self.assertTrue(os.path.isfile(manifest_path))
+
+            # Rewrite a file in place keeping its stat tuple, its verdict is carried over
+            path = os.path.join(self.test_dir2, "same_file.txt")
+            st = os.stat(path)
+            with open(path, "r+", encoding="utf-8") as f:
+                f.write("J")
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+            # A changed mtime makes the file be compared again
+            path = os.path.join(self.test_dir2, "different_file.txt")
+            self.create_file(path, "Content A")
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+            comparer = DirectoryComparer(
+                self.test_dir1, self.test_dir2,
+                since_manifest=manifest_path, save_manifest=manifest_path,
+            )
+            second = comparer.compare()
+            self.assertIn("same_file.txt", second["identical_files"])
+            self.assertIn("different_file.txt", second["identical_files"])
+            self.assertEqual(len(second["different_files"]), len(first["different_files"]) - 1)
+        finally:
+            shutil.rmtree(os.path.dirname(manifest_path))
+
+    def test_since_manifest_other_hash_algorithm(self):
+        """Test that digests of a manifest made with another hash algorithm are not reused"""
+        block = bytes(range(256)) * 512
+        for directory in (self.test_dir1, self.test_dir2):
+            with open(os.path.join(directory, "copy1.bin"), "wb") as f:
+                f.write(block)
+        with open(os.path.join(self.test_dir1, "copy2.bin"), "wb") as f:
+            f.write(block)
+        work_dir = tempfile.mkdtemp(prefix="manifest_")
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        manifest_path = os.path.join(work_dir, "run.hpfm")
+
+        results = []
+        for algorithm, options in (
+            ("sha256", {"cache_path": os.path.join(work_dir, "cache.db")}),
+            ("blake2b", {"since_manifest": manifest_path}),
+        ):
+            comparer = DirectoryComparer(
+                self.test_dir1, self.test_dir2, show_progress=False, hash_algorithm=algorithm,
+                find_duplicates=True, save_manifest=manifest_path, **options,
+            )
+            results.append(comparer.compare())
+        self.assertEqual(
+            sorted(results[1]["identical_files"]), sorted(results[0]["identical_files"])
+        )
+        self.assertEqual(len(results[1]["duplicate_files"]), 1)
+        self.assertEqual(results[1]["duplicate_files"][0]["files1"], ["copy1.bin", "copy2.bin"])
+
+        _, entries = read_manifest(manifest_path)
+        path = os.path.join(self.test_dir1, "copy1.bin")
+        for entry in entries:
+            if entry.rel_path == "copy1.bin" and entry.digest1 is not None:
+                self.assertEqual(entry.digest1, file_digest(path, 65536, "blake2b"))
+
+    def test_cli_corrupt_since_manifest(self):
+        """Test that the CLI reports a corrupt --since manifest without a traceback"""
+        work_dir = tempfile.mkdtemp(prefix="manifest_")
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        manifest_path = os.path.join(work_dir, "bad.hpfm")
+        self.create_file(manifest_path, "not a manifest")
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            code = main([
+                self.test_dir1, self.test_dir2, "--since", manifest_path, "--no-progress",
+                "--output", os.path.join(work_dir, "report.txt"),
+            ])
+        self.assertEqual(code, 1)
+        self.assertIn(f"Error: Not a manifest: {manifest_path}", stderr.getvalue())
+
+    def test_cli_unreadable_since_manifest(self):
+        """Test that the CLI reports a --since manifest it cannot open without a traceback"""
+        work_dir = tempfile.mkdtemp(prefix="manifest_")
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        manifest_path = os.path.join(work_dir, "run.hpfm")
+        self.create_file(manifest_path, "")
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        denied = PermissionError(13, "Permission denied")
+        with mock.patch("src.hpfc.manifest.gzip.open", side_effect=denied), \
+                contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            code = main([self.test_dir1, self.test_dir2, "--since", manifest_path, "--no-progress"])
+        self.assertEqual(code, 1)
+        self.assertIn(
+            f"Error: Cannot read manifest: {manifest_path} ([Errno 13] Permission denied)",
+            stderr.getvalue(),
+        )
+
+    def test_against_tree_manifest(self):
+        """Test that comparing against a tree manifest matches comparing the folders"""
+        manifest_path = os.path.join(tempfile.mkdtemp(prefix="manifest_"), "tree.hpfm")
+        try:
+            count, errors = create_tree_manifest(
+                self.test_dir1, manifest_path, show_progress=False
+            )
+            self.assertEqual(errors, [])
+            self.assertEqual(count, 5)
+
+            expected = DirectoryComparer(self.test_dir1, self.test_dir2).compare()
+            results = DirectoryComparer(
+                manifest_path, self.test_dir2, against_manifest=True
+            ).compare()
+            for key in ("identical_files", "different_files", "missing_files", "extra_files"):
+                self.assertEqual(sorted(results[key]), sorted(expected[key]))
+        finally:
+            shutil.rmtree(os.path.dirname(manifest_path))
+
+    def test_cli_bad_against_manifest(self):
+        """Test that the CLI reports a file given to --against that is not a manifest"""
+        work_dir = tempfile.mkdtemp(prefix="manifest_")
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        manifest_path = os.path.join(work_dir, "bad.hpfm")
+        self.create_file(manifest_path, "not a manifest")
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            code = main(["--against", manifest_path, self.test_dir2, "--no-progress"])
+        self.assertEqual(code, 1)
+        self.assertIn(f"Error: Not a manifest: {manifest_path}", stderr.getvalue())
+        self.assertNotIn("Traceback", stderr.getvalue())
+
+    def test_block_diff_map(self):
+        """Test that differing blocks and bytes of differing files are mapped"""
+        data = bytes(range(256)) * 64  # 16KB, four 4KB blocks
+        changed = bytearray(data)
+        changed[10] ^= 0xFF
+        changed[4096 * 3 + 1] ^= 0xFF
+        changed[4096 * 3 + 2] ^= 0xFF
+        with open(os.path.join(self.test_dir1, "image.bin"), "wb") as f:
+            f.write(data)
+        with open(os.path.join(self.test_dir2, "image.bin"), "wb") as f:
+            f.write(changed)
+
+        for engine in ("stream", "mmap"):
+            comparer = DirectoryComparer(
+                self.test_dir1, self.test_dir2, chunk_size=8192, engine=engine,
+                diff_block_size=4096,
+            )
+            results = comparer.compare()
+            self.assertIn("image.bin", results["different_files"])
+            diff = results["block_diffs"]["image.bin"]
+            self.assertEqual(diff["runs"], [(0, 1), (3, 1)])
+            self.assertEqual(diff["differing_blocks"], 2)
+            self.assertEqual(diff["differing_bytes"], 3)
+            self.assertIn("2 blocks of 4096 bytes, 3 bytes differ: 0, 3",
+                          comparer.generate_html_report(results))
+
+        # With a cache, the digests come from the mapping pass, and files whose
+        # digests are cached are still mapped
+        cache_path = os.path.join(tempfile.mkdtemp(prefix="cache_"), "cache.db")
+        self.addCleanup(shutil.rmtree, os.path.dirname(cache_path), ignore_errors=True)
+        for _ in range(2):
+            results = DirectoryComparer(
+                self.test_dir1, self.test_dir2, chunk_size=8192, diff_block_size=4096,
+                cache_path=cache_path,
+            ).compare()
+            self.assertEqual(results["block_diffs"]["image.bin"]["runs"], [(0, 1), (3, 1)])
+        path = os.path.join(self.test_dir2, "image.bin")
+        st = os.stat(path)
+        with HashCache(cache_path) as cache:
+            self.assertEqual(
+                cache.get(path, st.st_size, st.st_mtime_ns, st.st_ino),
+                file_digest(path, 8192),
+            )
+
+        with self.assertRaises(ValueError):
+            DirectoryComparer(self.test_dir1, self.test_dir2, against_manifest=True,
+                              diff_block_size=4096)
+
+    def test_streaming_reports(self):
+        """Test that streaming report formats write a record per file and a summary"""
+        stream = io.StringIO()
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, show_progress=False)
+        counts = write_streaming_report(comparer, "ndjson", stream)
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r["type"] for r in records], ["file"] * 6 + ["summary"])
+        self.assertEqual(records[-1]["counts"]["different"], 2)
+        self.assertEqual(counts["missing"], 1)
+
+        stream = io.StringIO()
+        write_streaming_report(comparer, "json", stream)
+        document = json.loads(stream.getvalue())
+        self.assertEqual(len(document["files"]), 6)
+        self.assertEqual(document["summary"]["counts"]["identical"], 2)
+
+        stream = io.StringIO()
+        write_streaming_report(comparer, "csv", stream)
+        rows = list(csv.reader(io.StringIO(stream.getvalue())))
+        self.assertIn(["file", "only_in_dir1.txt", "missing", "", "", "", "", "", ""], rows)
+        self.assertIn(["summary", "extra_files", "1"], rows)
+
+        # Block runs can be turned into byte ranges with the summary's block size
+        stream = io.StringIO()
+        comparer = DirectoryComparer(
+            self.test_dir1, self.test_dir2, show_progress=False, diff_block_size=4
+        )
+        write_streaming_report(comparer, "ndjson", stream)
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(records[-1]["block_size"], 4)
+        self.assertTrue(any("diff_blocks" in record for record in records[:-1]))
+
+        # A writer without its record hooks cannot be created
+        with self.assertRaises(TypeError):
+            ReportWriter(io.StringIO())
+
+    def test_phase_timing_and_trace(self):
+        """Test that phase times cover the run and traces hold phase and worker spans"""
+        comparer = DirectoryComparer(
+            self.test_dir1, self.test_dir2, show_progress=False, trace=True
+        )
+        results = comparer.compare()
+        phase_times = results["phase_times"]
+        for phase in ("scan", "set_diff", "plan", "wait", "collect", "report"):
+            self.assertIn(phase, phase_times)
+        self.assertLessEqual(sum(phase_times.values()), results["time_elapsed"] + 0.01)
+        self.assertEqual(
+            set(results["scan_times"]), {comparer.dir1, comparer.dir2}
+        )
+        self.assertGreater(results["worker_times"]["busy"], 0)
+        self.assertGreaterEqual(results["worker_times"]["transit"], 0)
+        self.assertIn("Phase times: ", comparer.generate_text_report(results))
+
+        trace_path = os.path.join(self.test_dir1, "trace.json")
+        comparer.write_trace(trace_path)
+        with open(trace_path, encoding="utf-8") as f:
+            events = json.load(f)["traceEvents"]
+        names = {event["name"] for event in events}
+        self.assertIn("scan", names)
+        self.assertIn("small batch", names)
+
+        with self.assertRaises(ValueError):
+            DirectoryComparer(self.test_dir1, self.test_dir2).write_trace(trace_path)
+
+    def test_metrics_export(self):
+        """Test the Prometheus endpoint and the JSON-lines stats file"""
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2, show_progress=False)
+        stats_dir = tempfile.mkdtemp(prefix="test_stats_")
+        self.addCleanup(shutil.rmtree, stats_dir, ignore_errors=True)
+        stats_path = os.path.join(stats_dir, "stats.jsonl")
+        with MetricsExporter(comparer, port=0, stats_path=stats_path, interval=60) as exporter:
+            comparer.compare()
+            url = f"http://127.0.0.1:{exporter.port}/metrics"
+            with urllib.request.urlopen(url) as response:
+                metrics = response.read().decode("utf-8")
+        self.assertIn('hpfc_files_total{status="different"} 2', metrics)
+        self.assertIn("hpfc_differences_total 4", metrics)
+        self.assertIn('hpfc_lane_files_total{lane="small"} 4', metrics)
+        self.assertIn("hpfc_running 0", metrics)
+        # 4 common files, one missing and one extra
+        self.assertIn("hpfc_files_planned 6", metrics)
+
+        with open(stats_path, encoding="utf-8") as f:
+            stats = [json.loads(line) for line in f]
+        # The interval did not elapse, only the final line is written
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["counts"]["missing"], 1)
+        self.assertEqual(stats[0]["files_done"], 6)
+        self.assertFalse(stats[0]["running"])
+
+    def test_benchmark(self):
+        """Test that synthetic tree pairs are reproducible and benchmarked per configuration"""
+        first = generate_tree_pair(os.path.join(self.test_dir1, "a"), "deep", 0.01, 0.5, seed=7)
+        second = generate_tree_pair(os.path.join(self.test_dir1, "b"), "deep", 0.01, 0.5, seed=7)
+        self.assertEqual(first["files"], 20)
+        self.assertEqual(first["bytes"], second["bytes"])
+        self.assertEqual(first["differing"], second["differing"])
+        comparer = DirectoryComparer(first["dir1"], first["dir2"], show_progress=False)
+        results = comparer.compare()
+        self.assertEqual(len(results["different_files"]), sum(first["differing"].values()))
+
+        report = run_benchmark(
+            self.test_dir1, "tiny", 0.001, 0.1, chunk_sizes=[4096], workers=[1, 2],
+            engines=["stream"],
+        )
+        self.assertEqual(len(report["runs"]), 2)
+        for run in report["runs"]:
+            self.assertEqual(run["identical"] + run["different"], report["tree"]["files"])
+            self.assertGreater(run["files_per_s"], 0)
+            self.assertIn("scan_time", run)
+            self.assertIn("peak_rss_mb", run)
+
+    def test_digest_cache(self):
+        """Test that unchanged files are resolved from the digest cache"""
+        cache_path = os.path.join(tempfile.mkdtemp(prefix="cache_"), "hpfc.db")
+        try:
+            comparer = DirectoryComparer(self.test_dir1, self.test_dir2, cache_path=cache_path)
+            first = comparer.compare()
+
+            # Rewrite a file in place without changing its size or mtime, the cached
+            # digest is trusted so the change is not noticed
+            path = os.path.join(self.test_dir2, "same_file.txt")
+            st = os.stat(path)
+            with open(path, "r+", encoding="utf-8") as f:
+                f.write("J")
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+            comparer = DirectoryComparer(self.test_dir1, self.test_dir2, cache_path=cache_path)
+            second = comparer.compare()
+            self.assertEqual(sorted(first["identical_files"]), sorted(second["identical_files"]))
+            self.assertEqual(sorted(first["different_files"]), sorted(second["different_files"]))
+
+            # Evicting down to a small cap keeps the cache bounded
+            with HashCache(cache_path, max_entries=2) as cache:
+                self.assertEqual(cache.evict(), 6)
+        finally:
+            shutil.rmtree(os.path.dirname(cache_path), ignore_errors=True)
+
 
 class TestDirectoryComparerReport(unittest.TestCase):
     """Test report generation functionality"""
@@ -277,6 +979,50 @@ class TestDirectoryComparerReport(unittest.TestCase):
         self.assertIn("</div>", report)
         self.assertIn("</html>", report)
 
+    def test_scalable_html_report(self):
+        """Test that scalable HTML reports embed the file lists as JSON"""
+        comparer = DirectoryComparer(self.test_dir1, self.test_dir2)
+        self.mock_results["different_files"].append("evil</script><b>.txt")
+
+        report = comparer.generate_html_report(self.mock_results, mode="scalable")
+        self.assertIn('id="report-data"', report)
+        self.assertIn("diff1.txt", report)
+        self.assertIn("Permission denied", report)
+        self.assertNotIn("</script><b>", report)
+        self.assertNotIn("<li>diff1.txt", report)
+
+        report = comparer.generate_html_report(self.mock_results, mode="compressed")
+        self.assertIn('data-encoding="gzip"', report)
+        self.assertNotIn("diff1.txt", report)
+
+        report = comparer.generate_html_report(self.mock_results, mode="inline")
+        self.assertIn("evil&lt;/script&gt;&lt;b&gt;.txt", report)
+
+
+class TestProgressBar(unittest.TestCase):
+    """Test the progress bar"""
+
+    def test_byte_weighted_progress(self):
+        """Test that progress follows bytes and updates leave drawing to the ticker"""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            progress = ProgressBar(4, total_bytes=1000, interval=60)
+            progress.update(3, 10)
+            drawn = output.getvalue()
+            progress.update(nbytes=990)
+            progress.close()
+        self.assertIn("0.0% 0/4", drawn)
+        self.assertNotIn("3/4", drawn)
+        lines = output.getvalue().split("\r")
+        self.assertIn("100.0% 4/4 (0.0/0.0 MB)", lines[-1])
+        self.assertIn("Completed in", lines[-1])
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with ProgressBar(4, total_bytes=1000, interval=60) as progress:
+                progress.update(3, 10)
+        self.assertIn("1.0% 3/4", output.getvalue())
+
 
 if __name__ == "__main__":
     unittest.main()